@@ -1,24 +1,39 @@
-from pydantic_settings import BaseSettings
+from pydantic_settings import BaseSettings, SettingsConfigDict
 from typing import Optional
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
 
 class Settings(BaseSettings):
-    aws_access_key_id: str = os.getenv("AWS_ACCESS_KEY_ID", "")
-    aws_secret_access_key: str = os.getenv("AWS_SECRET_ACCESS_KEY", "")
-    aws_region: str = os.getenv("AWS_REGION", "us-east-1")
-    twilio_account_sid: str = os.getenv("TWILIO_ACCOUNT_SID", "")
-    twilio_auth_token: str = os.getenv("TWILIO_AUTH_TOKEN", "")
-    twilio_phone_number: str = os.getenv("TWILIO_PHONE_NUMBER", "")
-    openai_api_key: str = os.getenv("OPENAI_API_KEY", "")
-    laravel_api_base_url: str = os.getenv("LARAVEL_API_BASE_URL", "http://localhost")
-    app_env: str = os.getenv("APP_ENV", "development")
-    log_level: str = os.getenv("LOG_LEVEL", "INFO")
-    webhook_base_url: Optional[str] = os.getenv("WEBHOOK_BASE_URL")
+    # Values come from the environment or .env, matched case-insensitively by field name
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore")
     
-    class Config:
-        env_file = ".env"
+    aws_access_key_id: str = ""
+    aws_secret_access_key: str = ""
+    aws_region: str = "us-east-1"
+    twilio_account_sid: str = ""
+    twilio_auth_token: str = ""
+    twilio_phone_number: str = ""
+    openai_api_key: str = ""
+    laravel_api_base_url: str = "http://localhost"
+    app_env: str = "development"
+    log_level: str = "INFO"
+    # Share of successful HTTP requests logged by the request middleware
+    request_log_sample_rate: float = 0.1
+    webhook_base_url: Optional[str] = None
+    catalog_cache_ttl_seconds: int = 300
+    max_active_calls: int = 5000
+    call_idle_ttl_seconds: int = 1800
+    llm_history_turns: int = 6
+    # Concurrent Laravel API calls a single turn may have in flight
+    api_calls_per_turn: int = 4
+    # Whisper requests in flight across all calls, to stay under the provider rate limit
+    whisper_max_concurrency: int = 8
+    # Conversation LLM requests in flight across all calls
+    llm_max_concurrency: int = 16
+    llm_response_cache_size: int = 2048
+    llm_response_cache_ttl_seconds: int = 86400
+    extractor_cache_size: int = 2048
+    # Shared secret for /admin endpoints (X-Admin-Token header); they are disabled when unset
+    admin_token: Optional[str] = None
+    # Shared conversation state across workers; in-process when unset
+    redis_url: Optional[str] = None
 
 settings = Settings()
\ No newline at end of file
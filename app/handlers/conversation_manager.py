@@ -1,25 +1,175 @@
 from loguru import logger
-from typing import Dict, Optional
+from typing import Annotated, Dict, List, Optional, Tuple
+from typing_extensions import TypedDict
+from pydantic import BeforeValidator, TypeAdapter, ValidationError
 from app.models.conversation import ConversationContext, ConversationState, CustomerInfo
 from app.services.langchain_service import langchain_service
 from app.services.pizza_api_service import pizza_api
-from app.services.polly_service import polly_service
-from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
+from app.services.catalog_cache import catalog_cache
+from app.services.openai_client import openai_client
 from app.config.settings import settings
-import json
+from app.services.conversation_store import ConversationStore
+from app.utils.ttl_cache import TTLCache
+import asyncio
+import hashlib
+import orjson
+import re
+import weakref
+from xml.sax.saxutils import escape
+
+# Compiled once at import; these run on every customer info turn (against casefolded text)
+_NON_DIGIT_RE = re.compile(r'\D+')
+# Trigger keywords gate each pattern with cheap substring checks before the regex runs
+_NAME_TRIGGERS = ("nombre", "llamo", "soy")
+_ADDR_TRIGGERS = ("dirección", "direccion", "vivo en", "calle", "avenida")
+# Names end with their clause or sentence. A bare "soy" also introduces "soy cliente nuevo" /
+# "soy de la Roma" / "soy alérgico", so it only takes 1-3 words that don't start like one of
+# those, and only if the first is capitalized (checked on the original text)
+_NAME_RE = re.compile(
+    r'\b(?:mi\s+nombre\s+es|me\s+llamo)\s+([^,.?!]+?)(?:\s+y\s+|[,.?!]|$)'
+    r'|\bsoy\s+(?!(?:de|del|el|la|los|las|un|una|su|tu|yo|él|ella|cliente|nuevo|nueva)\b)'
+    r'([^\W\d_]+(?:\s+[^\W\d_]+){0,2})(?=\s*(?:[,.?!]|$)|\s+y\s+)'
+)
+_SOY_NAME_GROUP = 2
+# "mi dirección es ..." / "vivo en ...", or a bare street ("calle Juárez 12") kept whole; an
+# address ends with its clause or sentence (transcripts are punctuated)
+_ADDR_RE = re.compile(
+    r'\b(?:(?:mi\s+)?direcci[oó]n(?:\s+es)?[:\s]+|vivo\s+en\s+)([^,.?!]+?)(?:\s+y\s+|[,.?!]|$)'
+    # A bare calle/avenida needs a street name or number after it, not "la calle es larga"
+    r'|\b((?:calle|avenida)\s+'
+    r'(?!(?:es|está|esta|era|son|de|del|el|la|los|las|que|muy|se|no|con|por|para|en|y)\b)'
+    r'(?:\d|[^\W\d_]{2,})[^,.?!]*?)(?:\s+y\s+|[,.?!]|$)'
+)
+
+# Cart confirmations that can be routed to create_order without the LLM
+_WORD_RE = re.compile(r'\w+')
+_AFFIRMATIVE_WORDS = frozenset({"si", "sí", "claro", "correcto", "confirmo", "confirma", "dale", "ok", "vale", "perfecto", "exacto"})
+_FILLER_WORDS = frozenset({"por", "favor", "gracias", "eso", "es", "todo", "así", "asi", "está", "esta", "bien"})
+# "No, gracias" / "eso es todo" to "¿algo más?" while ordering: show the cart without the LLM
+_DONE_WORDS = frozenset({"no", "nada", "listo", "ya", "todo"})
+_DONE_FILLER_WORDS = _FILLER_WORDS | {"más", "mas", "sería", "seria"}
+# A bare "no" only means "that's all" as the answer to one of these
+_MORE_PROMPTS = ("algo más", "algo mas", "otra cosa", "algo adicional")
+
+_PHONE_SEPARATORS = frozenset(" -.")
+
+def _extract_phone(message: str) -> Optional[str]:
+    """Return the longest digit run (spaces/dashes allowed inside) if it looks like a phone"""
+    best = ""
+    run = []
+    for char in message:
+        if char.isdigit():
+            run.append(char)
+        elif run and char in _PHONE_SEPARATORS:
+            continue
+        elif run:
+            if len(run) > len(best):
+                best = "".join(run)
+            run = []
+    if len(run) > len(best):
+        best = "".join(run)
+    return best if len(best) >= 7 else None
+
+# TwiML skeletons around the XML-escaped message; joined by concatenation, no format parsing
+_TWIML_SAY_PREFIX = '<Response><Say language="es-ES">'
+_TWIML_GATHER_SUFFIX = (
+    '</Say>'
+    '<Gather input="speech" action="/voice/process-speech" method="POST" '
+    'speechTimeout="3" language="es-ES"/>'
+    '<Say language="es-ES">No pude escucharte. ¿Puedes repetir?</Say>'
+    '<Redirect>/voice/incoming</Redirect>'
+    '</Response>'
+)
+_TWIML_HANGUP_SUFFIX = '</Say><Hangup/></Response>'
+
+# Fixed instructions go in the system message and only the customer message follows it,
+# so every extractor request shares the same prompt prefix (cacheable by the provider)
+_EXTRACTOR_SYSTEM_PROMPT = """
+You are an expert at extracting customer information from Spanish voice messages for pizza delivery orders.
+
+Extract information from the customer message. Common Spanish patterns:
+- Names: "mi nombre es", "me llamo", "soy"
+- Phone: "mi número es", "mi teléfono es", numbers like "555 120 12"
+- Address: "mi dirección es", "vivo en", "calle", street addresses
+
+Return ONLY a JSON object:
+{
+    "name": "extracted name or null",
+    "phone": "extracted phone (digits only) or null", 
+    "address": "extracted address or null"
+}
+
+Important: Extract ALL digits from phone numbers regardless of spaces.
+"""
+
+# Only the order id and URL vary; the rest is fixed text without the old template's indentation
+_ORDER_CONFIRMED = (
+    "¡Perfecto! Tu pedido número {order_id} ha sido confirmado. "
+    "Puedes ver los detalles en: {view_url} "
+    "Te llegará en aproximadamente 30 minutos. "
+    "¡Gracias por elegir Pizza Project!"
+)
+
+# Phones sometimes come back as JSON numbers
+_Text = Annotated[str, BeforeValidator(lambda value: str(value) if isinstance(value, (int, float)) else value)]
+
+class _ExtractedInfo(TypedDict, total=False):
+    name: Optional[str]
+    phone: Optional[_Text]
+    address: Optional[str]
+
+_EXTRACTION_ADAPTER = TypeAdapter(_ExtractedInfo)
+
+_TRANSFER_MESSAGE = "Parece que tenemos dificultades. Te transfiero con un operador humano."
+
+# Every fixed utterance the agent can speak; pre-synthesized at startup
+CANNED_PROMPTS = (
+    "¡Hola! Bienvenido a Pizza Project. ¿Qué desea ordenar hoy?",
+    "No pude cargar el menú. Intenta más tarde.",
+    "Disculpa, tuve un problema técnico.",
+    "No pude agregar ese producto. ¿Puedes repetir tu pedido?",
+    _TRANSFER_MESSAGE,
+    "Perfecto. Tengo toda tu información. Voy a procesar tu pedido.",
+    "Por favor, dime tu nombre.",
+    "¿Cuál es tu número de teléfono?",
+    "¿Cuál es tu dirección de entrega?",
+    "Necesito tu información completa para procesar el pedido.",
+    "No pude procesar tu pedido. Intenta de nuevo.",
+    "Hubo un problema al procesar tu pedido.",
+    "Tu pedido ya fue procesado.",
+    "No pude escucharte. ¿Puedes repetir?",
+)
+
+def _render_twiml(text: str, hangup: bool) -> str:
+    """Wrap the escaped message in the TwiML skeleton"""
+    suffix = _TWIML_HANGUP_SUFFIX if hangup else _TWIML_GATHER_SUFFIX
+    return _TWIML_SAY_PREFIX + escape(text) + suffix
+
+# Canned utterances render to byte-identical TwiML on every call, so build them once
+_CANNED_TWIML = {
+    (text, hangup): _render_twiml(text, hangup)
+    for text in CANNED_PROMPTS
+    for hangup in (False, True)
+}
+
+def _twiml(text: str, hangup: bool) -> str:
+    """Get TwiML for a message, prebuilt for canned prompts"""
+    twiml = _CANNED_TWIML.get((text, hangup))
+    return twiml if twiml is not None else _render_twiml(text, hangup)
 
 class ConversationManager:
     """Manages conversation flow and state"""
     
     def __init__(self):
-        self.active_conversations: Dict[str, ConversationContext] = {}
-        self.extractor_llm = ChatOpenAI(
-            model_name="gpt-3.5-turbo",
-            temperature=0.1,
-            max_tokens=400,
-            openai_api_key=settings.openai_api_key,
-            streaming=False
+        self.active_conversations = ConversationStore()
+        self._pending_contexts: Dict[str, asyncio.Future] = {}
+        # One turn per call at a time; entries vanish once no turn holds or awaits the lock
+        self._call_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        # Extractor results by whitespace-normalized message; the extraction depends on nothing else
+        self._extraction_cache = TTLCache(
+            maxsize=settings.extractor_cache_size,
+            ttl=settings.llm_response_cache_ttl_seconds,
+            name="extractions"
         )
     
     async def process_customer_message(
@@ -37,48 +187,163 @@ class ConversationManager:
         Returns:
             Dict with 'action', 'message', and 'twiml'
         """
+        lock = self._call_locks.get(call_sid)
+        if lock is None:
+            lock = self._call_locks[call_sid] = asyncio.Lock()
+        
+        # Every log record emitted while handling this turn (services included) carries call_sid
+        with logger.contextualize(call_sid=call_sid):
+            # Webhook retries or overlapping utterances must not interleave state transitions
+            async with lock:
+                return await self._process_customer_message(call_sid, customer_message)
+    
+    async def _process_customer_message(self, call_sid: str, customer_message: str) -> Dict[str, str]:
+        """Handle one customer turn (see process_customer_message)"""
         try:
             context = await self._get_or_create_context(call_sid)
             context.last_customer_message = customer_message
             
-            if not context.catalog:
-                context.catalog = await pizza_api.get_catalog()
-                if not context.catalog:
+            # Terminal conversations need no LLM or API work
+            if context.state == ConversationState.ORDER_COMPLETE:
+                return await self._error_response("Tu pedido ya fue procesado.")
+            if context.attempts > 3:
+                return await self._voice_response(_TRANSFER_MESSAGE)
+            
+            ai_result = self._route_locally(context, customer_message)
+            routed_locally = ai_result is not None
+            if not routed_locally:
+                # Only LLM turns need the catalog; once loaded it is served from memory
+                catalog = await catalog_cache.get()
+                if not catalog:
+                    await self.end_conversation(call_sid)
                     return await self._error_response("No pude cargar el menú. Intenta más tarde.")
+                
+                ai_result = await langchain_service.process_customer_input(
+                    customer_message, 
+                    catalog,
+                    call_sid,
+                    cache_key=self._response_cache_key(context, customer_message),
+                    history=context.conversation_history,
+                    catalog_version=catalog_cache.version
+                )
             
-            ai_result = await langchain_service.process_customer_input(
-                customer_message, 
-                context.to_dict(),
-                context.catalog,
-                call_sid
+            # The context is updated in place; no serialize/rebuild per turn.
+            # History is kept to the LLM window so the stored context stays small on long calls.
+            context.apply_updates(
+                ai_result["context_updates"],
+                history_limit=2 * settings.llm_history_turns
             )
             
-            # Preserve the catalog when recreating context
-            catalog = context.catalog
-            context = ConversationContext.from_dict(ai_result["context"])
-            context.call_sid = call_sid
-            context.catalog = catalog
-            self.active_conversations[call_sid] = context
-            
-            return await self._execute_action(context, ai_result)
+            response = await self._execute_action(context, ai_result)
+            if routed_locally:
+                self._record_local_turn(context, customer_message, response["message"])
+            # Ended conversations were already released and must not be written back
+            if context.state != ConversationState.ERROR:
+                await self.active_conversations.set(call_sid, context)
+            return response
             
         except Exception as e:
             logger.error(f"Error processing customer message: {str(e)}")
+            await self.end_conversation(call_sid)
             return await self._error_response("Disculpa, tuve un problema técnico.")
     
+    def _response_cache_key(self, context: ConversationContext, customer_message: str) -> Optional[str]:
+        """Key an LLM reply on the turn; langchain_service adds the memory window the model sees"""
+        if catalog_cache.version is None:
+            return None
+        normalized = " ".join(customer_message.casefold().split())
+        payload = orjson.dumps([context.state.value, normalized, catalog_cache.version, context.attempts])
+        return hashlib.blake2b(payload, digest_size=16).hexdigest()
+    
+    def _route_locally(self, context: ConversationContext, customer_message: str) -> Optional[Dict]:
+        """Pick the action without the LLM when the state makes it obvious, else None"""
+        action = None
+        response_text = ""
+        if context.state == ConversationState.COLLECTING_INFO:
+            # Info collection runs its own (regex, then extractor) parsing
+            action = "collect_customer_info"
+        elif context.state == ConversationState.CONFIRMING_CART:
+            words = set(_WORD_RE.findall(customer_message.casefold()))
+            if words and words & _AFFIRMATIVE_WORDS and words <= _AFFIRMATIVE_WORDS | _FILLER_WORDS:
+                action = "create_order"
+        elif context.state == ConversationState.TAKING_ORDER and self._asked_for_more(context):
+            words = set(_WORD_RE.findall(customer_message.casefold()))
+            if words and words & _DONE_WORDS and words <= _DONE_WORDS | _DONE_FILLER_WORDS:
+                action = "confirm_cart"
+                response_text = "Muy bien."
+        
+        if action is None:
+            return None
+        
+        logger.info("Routed turn locally to action: {}", action)
+        return {
+            "action": action,
+            "response_text": response_text,
+            "product": None,
+            "size": None,
+            "quantity": 1,
+            "products": [],
+            # The exchange is recorded once the action has produced the reply
+            "context_updates": {}
+        }
+    
+    @staticmethod
+    def _asked_for_more(context: ConversationContext) -> bool:
+        """Whether the cart has items and the last reply asked if the caller wants anything else"""
+        if not context.cart_item_count or not context.conversation_history:
+            return False
+        last = context.conversation_history[-1]
+        if last["role"] != "assistant":
+            return False
+        reply = last["content"].casefold()
+        return any(prompt in reply for prompt in _MORE_PROMPTS)
+    
+    def _record_local_turn(self, context: ConversationContext, customer_message: str, reply: str):
+        """Record a locally routed exchange in history and LLM memory, as LLM turns are"""
+        # Completed or failed calls have already dropped their memory
+        if context.state in (ConversationState.ORDER_COMPLETE, ConversationState.ERROR):
+            return
+        langchain_service.record_exchange(
+            context.call_sid, customer_message, reply, history=context.conversation_history
+        )
+        context.apply_updates(
+            {"messages": [
+                {"role": "user", "content": customer_message},
+                {"role": "assistant", "content": reply}
+            ]},
+            history_limit=2 * settings.llm_history_turns
+        )
+    
+    async def end_conversation(self, call_sid: str):
+        """Release conversation state for a call that has ended"""
+        if await self.active_conversations.delete(call_sid):
+            logger.info("Released conversation state for {}", call_sid)
+        langchain_service.clear_memory(call_sid)
+    
     async def _get_or_create_context(self, call_sid: str) -> ConversationContext:
         """Get existing conversation or create new one"""
-        if call_sid in self.active_conversations:
-            return self.active_conversations[call_sid]
+        context = await self.active_conversations.get(call_sid)
+        if context is not None:
+            return context
         
+        # Concurrent first turns for one call (e.g. webhook retries) share a single cart creation
+        pending = self._pending_contexts.get(call_sid)
+        if pending is None:
+            pending = asyncio.ensure_future(self._create_context(call_sid))
+            self._pending_contexts[call_sid] = pending
+            pending.add_done_callback(lambda _: self._pending_contexts.pop(call_sid, None))
+        return await asyncio.shield(pending)
+    
+    async def _create_context(self, call_sid: str) -> ConversationContext:
+        """Create a conversation with its cart"""
         context = ConversationContext(call_sid=call_sid)
         
         cart_data = await pizza_api.create_cart()
         if cart_data:
             context.cart_token = cart_data["cart_token"]
-            logger.info(f"Created cart {context.cart_token} for call {call_sid}")
+            logger.info("Created cart {} for call {}", context.cart_token, call_sid)
         
-        self.active_conversations[call_sid] = context
+        await self.active_conversations.set(call_sid, context)
         return context
     
     async def _execute_action(self, context: ConversationContext, ai_result: Dict) -> Dict[str, str]:
@@ -86,19 +351,28 @@ class ConversationManager:
         action = ai_result["action"]
         response_text = ai_result["response_text"]
         
-        logger.info(f"Executing action: {action} with ai_result: {ai_result}")
+        logger.info("Executing action: {}", action)
+        # The full result is large; only rendered when a sink takes DEBUG
+        logger.debug("AI result: {}", ai_result)
         
         if action == "welcome":
             context.update_state(ConversationState.TAKING_ORDER)
             return await self._voice_response(response_text)
         
         elif action == "add_product":
-            success = await self._add_product_to_cart(context, ai_result)
-            if success:
+            added, failed = await self._add_product_to_cart(context, ai_result)
+            if not failed:
                 context.update_state(ConversationState.TAKING_ORDER)
                 return await self._voice_response(response_text)
-            else:
+            elif not added:
                 return await self._voice_response("No pude agregar ese producto. ¿Puedes repetir tu pedido?")
+            else:
+                # The rest is already in the cart; asking for the whole order again would add it twice
+                context.update_state(ConversationState.TAKING_ORDER)
+                names = ", ".join(item.get("product") or "un producto" for item in failed)
+                return await self._voice_response(
+                    f"Agregué lo demás, pero no pude agregar: {names}. ¿Puedes repetirme solo eso?"
+                )
         
         elif action == "confirm_cart":
             cart_summary = await self._get_cart_summary(context)
@@ -113,7 +387,7 @@ class ConversationManager:
         elif action == "create_order":
             # If customer info is incomplete, try to extract from the current message first
             if not context.is_customer_info_complete():
-                logger.info(f"[CREATE_ORDER] Customer info incomplete, trying to extract from message: '{context.last_customer_message}'")
+                logger.info("[CREATE_ORDER] Customer info incomplete, trying to extract from message: '{}'", context.last_customer_message)
                 
                 # Temporarily switch to collecting info mode and extract data
                 temp_ai_result = {"response_text": "Extrayendo información..."}
@@ -121,10 +395,10 @@ class ConversationManager:
                 
                 # Check if we now have complete info
                 if context.is_customer_info_complete():
-                    logger.info(f"[CREATE_ORDER] Info extracted successfully, proceeding with order")
+                    logger.info("[CREATE_ORDER] Info extracted successfully, proceeding with order")
                     return await self._create_order(context)
                 else:
-                    logger.info(f"[CREATE_ORDER] Still missing info, asking for it")
+                    logger.info("[CREATE_ORDER] Still missing info, asking for it")
                     context.update_state(ConversationState.COLLECTING_INFO)
                     return temp_response
             else:
@@ -137,26 +411,52 @@ class ConversationManager:
             
             context.increment_attempts()
             if context.attempts > 3:
-                return await self._voice_response("Parece que tenemos dificultades. Te transfiero con un operador humano.")
+                # Later turns short-circuit to the transfer line, so the chat history is dead weight
+                langchain_service.clear_memory(context.call_sid)
+                return await self._voice_response(_TRANSFER_MESSAGE)
             return await self._voice_response(response_text)
         
         else:  # error - but don't hang up, just respond
             return await self._voice_response(response_text)
     
-    async def _add_product_to_cart(self, context: ConversationContext, ai_result: Dict) -> bool:
-        """Add product to cart based on AI parsing"""
+    async def _add_product_to_cart(self, context: ConversationContext, ai_result: Dict) -> Tuple[List[Dict], List[Dict]]:
+        """Add product(s) to cart based on AI parsing; returns the (added, failed) items"""
+        items = ai_result.get("products") or [{
+            "product": ai_result.get("product"),
+            "size": ai_result.get("size"),
+            "quantity": ai_result.get("quantity", 1)
+        }]
+        
+        # Items are independent, so their add-to-cart round-trips can overlap, but a
+        # long order may only hold a few pooled connections at once
+        budget = asyncio.Semaphore(settings.api_calls_per_turn)
+        
+        async def add_item(item: Dict) -> bool:
+            async with budget:
+                return await self._add_item_to_cart(context, item)
+        
+        results = await asyncio.gather(
+            *(add_item(item) for item in items),
+            return_exceptions=True
+        )
+        added = [item for item, result in zip(items, results) if result is True]
+        failed = [item for item, result in zip(items, results) if result is not True]
+        context.cart_item_count += len(added)
+        return added, failed
+    
+    async def _add_item_to_cart(self, context: ConversationContext, item: Dict) -> bool:
+        """Add a single parsed item to the cart"""
         try:
-            product_name = ai_result.get("product")
-            size_name = ai_result.get("size")
-            quantity = ai_result.get("quantity", 1)
+            product_name = item.get("product")
+            size_name = item.get("size")
+            quantity = item.get("quantity", 1)
             
             if not product_name:
                 return False
             
-            # Find product in catalog
-            product = await pizza_api.find_product_by_name(product_name, context.catalog)
+            product = await catalog_cache.find_product(product_name)
             if not product:
-                logger.warning(f"Product not found: {product_name}")
+                logger.warning("Product not found: {}", product_name)
                 return False
             
             product_id = product.get("id")  # We'll need to add ID to catalog
@@ -164,11 +464,9 @@ class ConversationManager:
             
             # Handle pizza size
             if size_name and "prices_by_size" in product:
-                pizza_sizes = await pizza_api.get_pizza_sizes(context.catalog)
-                for size in pizza_sizes:
-                    if size_name.lower() in size["name"].lower():
-                        pizza_size_id = size.get("id")
-                        break
+                size = catalog_cache.find_size(size_name)
+                if size:
+                    pizza_size_id = size.get("id")
             
             # Actually add the product to cart
             success = await pizza_api.add_product_to_cart(
@@ -179,10 +477,10 @@ class ConversationManager:
             )
             
             if success:
-                logger.info(f"Successfully added: {product_name} (id: {product_id}, size_id: {pizza_size_id}, qty: {quantity})")
+                logger.info("Successfully added: {} (id: {}, size_id: {}, qty: {})", product_name, product_id, pizza_size_id, quantity)
                 return True
             else:
-                logger.error(f"Failed to add product {product_name} to cart")
+                logger.error("Failed to add product {} to cart", product_name)
                 return False
             
         except Exception as e:
@@ -202,17 +500,11 @@ class ConversationManager:
             items = cart_data["data"]["items"]
             total = cart_data["data"]["total"]
             
-            summary = "En tu carrito tienes: "
-            for item in items:
-                product_name = item["product"]["name"]
-                quantity = item["quantity"]
-                price = item["subtotal"]
-                summary += f"{quantity} {product_name} por ${price}, "
-            
-            summary = summary.rstrip(", ")
-            summary += f". Total: ${total}."
-            
-            return summary
+            parts = [
+                f"{item['quantity']} {item['product']['name']} por ${item['subtotal']}"
+                for item in items
+            ]
+            return "En tu carrito tienes: " + ", ".join(parts) + f". Total: ${total}."
             
         except Exception as e:
             logger.error(f"Error getting cart summary: {str(e)}")
@@ -220,80 +512,111 @@ class ConversationManager:
     
     async def _extract_customer_info_ai(self, message: str) -> Dict[str, Optional[str]]:
         """Extract customer information using AI"""
+        cache_key = " ".join(message.split())
+        cached = self._extraction_cache.get(cache_key)
+        if cached is not None:
+            logger.info("[AI_EXTRACTOR] Cache hit")
+            return dict(cached)
+        
         try:
-            prompt = ChatPromptTemplate.from_template("""
-You are an expert at extracting customer information from Spanish voice messages for pizza delivery orders.
-
-Customer message: "{message}"
-
-Extract information from this message. Common Spanish patterns:
-- Names: "mi nombre es", "me llamo", "soy"
-- Phone: "mi número es", "mi teléfono es", numbers like "555 120 12"
-- Address: "mi dirección es", "vivo en", "calle", street addresses
-
-Return ONLY a JSON object:
-{{
-    "name": "extracted name or null",
-    "phone": "extracted phone (digits only) or null", 
-    "address": "extracted address or null"
-}}
-
-Important: Extract ALL digits from phone numbers regardless of spaces.
-""")
-            
-            response = await self.extractor_llm.apredict(prompt.format(message=message))
-            logger.info(f"[AI_EXTRACTOR] Raw response: {response}")
+            # Plain SDK call: this one-shot request needs no chain, memory or callbacks
+            completion = await openai_client.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": _EXTRACTOR_SYSTEM_PROMPT},
+                    {"role": "user", "content": f'Customer message: "{message}"'}
+                ],
+                temperature=0.1,
+                max_tokens=400,
+                response_format={"type": "json_object"}
+            )
+            response = completion.choices[0].message.content
+            logger.info("[AI_EXTRACTOR] Raw response: {}", response)
             
-            # Parse JSON response
-            if response.strip().startswith('{'):
-                data = json.loads(response.strip())
-                return {
-                    "name": data.get("name"),
-                    "phone": data.get("phone"), 
-                    "address": data.get("address")
-                }
+            # JSON mode guarantees an object; the adapter checks its shape in one compiled pass
+            data = _EXTRACTION_ADAPTER.validate_json(response)
+            extracted = {
+                "name": data.get("name"),
+                "phone": data.get("phone"), 
+                "address": data.get("address")
+            }
+            self._extraction_cache[cache_key] = extracted
+            return dict(extracted)
             
+        except ValidationError as e:
+            logger.warning("[AI_EXTRACTOR] Malformed response: {}", e)
             return {"name": None, "phone": None, "address": None}
-            
         except Exception as e:
             logger.error(f"Error in AI extraction: {str(e)}")
             return {"name": None, "phone": None, "address": None}
     
-    async def _collect_customer_info(self, context: ConversationContext, ai_result: Dict) -> Dict[str, str]:
-        """Collect customer information using AI extraction"""
-        response_text = ai_result["response_text"]
+    def _extract_customer_info_regex(self, message: str) -> Dict[str, Optional[str]]:
+        """Extract customer info from common Spanish phrasings without the LLM"""
+        # Match once against a casefolded copy; slice the original so names keep their casing
+        message_cf = message.casefold()
+        source = message if len(message_cf) == len(message) else message_cf
         
-        # Parse customer info from the message using AI
-        customer_message = context.last_customer_message.strip()
-        
-        logger.info(f"[COLLECT_INFO] Current state: name='{context.customer_info.name}', phone='{context.customer_info.phone}', address='{context.customer_info.address}'")
-        logger.info(f"[COLLECT_INFO] Customer message: '{customer_message}'")
+        def capture(pattern: re.Pattern, triggers: tuple) -> Optional[Tuple[int, str]]:
+            if not any(trigger in message_cf for trigger in triggers):
+                return None
+            match = pattern.search(message_cf)
+            if not match:
+                return None
+            group = match.lastindex
+            return group, source[match.start(group):match.end(group)].strip(" .")
         
-        # Use AI to extract customer information
-        extracted_info = await self._extract_customer_info_ai(customer_message)
-        
-        # Update context with extracted information (only if not already present)
+        name = capture(_NAME_RE, _NAME_TRIGGERS)
+        if name is not None and name[0] == _SOY_NAME_GROUP and not name[1][:1].isupper():
+            name = None
+        address = capture(_ADDR_RE, _ADDR_TRIGGERS)
+        return {
+            "name": name and name[1],
+            "phone": _extract_phone(message),
+            "address": address and address[1]
+        }
+    
+    def _merge_customer_info(self, context: ConversationContext, extracted_info: Dict[str, Optional[str]], source: str):
+        """Fill missing customer fields from extracted info (never overwrites)"""
         if not context.customer_info.name and extracted_info.get("name"):
             context.customer_info.name = extracted_info["name"]
-            logger.info(f"[COLLECT_INFO] AI extracted name: '{extracted_info['name']}'")
+            logger.info("[COLLECT_INFO] {} extracted name: '{}'", source, extracted_info["name"])
         
         if not context.customer_info.phone and extracted_info.get("phone"):
             # Clean phone number to digits only
-            phone = ''.join(filter(str.isdigit, extracted_info["phone"]))
+            phone = _NON_DIGIT_RE.sub('', extracted_info["phone"])
             if len(phone) >= 7:  # Valid phone number
                 context.customer_info.phone = phone
-                logger.info(f"[COLLECT_INFO] AI extracted phone: '{phone}'")
+                logger.info("[COLLECT_INFO] {} extracted phone: '{}'", source, phone)
         
         if not context.customer_info.address and extracted_info.get("address"):
             context.customer_info.address = extracted_info["address"]
-            logger.info(f"[COLLECT_INFO] AI extracted address: '{extracted_info['address']}'")
+            logger.info("[COLLECT_INFO] {} extracted address: '{}'", source, extracted_info["address"])
+    
+    async def _collect_customer_info(self, context: ConversationContext, ai_result: Dict) -> Dict[str, str]:
+        """Collect customer information using regex and AI extraction"""
+        response_text = ai_result["response_text"]
+        
+        # Parse customer info from the message using AI
+        customer_message = context.last_customer_message.strip()
+        
+        # Loguru formats "{}" args only if a sink accepts the level, unlike eager f-strings
+        customer_info = context.customer_info
+        logger.info("[COLLECT_INFO] Current state: name='{}', phone='{}', address='{}'", customer_info.name, customer_info.phone, customer_info.address)
+        logger.info("[COLLECT_INFO] Customer message: '{}'", customer_message)
+        
+        # Deterministic patterns first; the LLM only runs if something is still missing
+        self._merge_customer_info(context, self._extract_customer_info_regex(customer_message), "Regex")
+        
+        if not context.is_customer_info_complete():
+            extracted_info = await self._extract_customer_info_ai(customer_message)
+            self._merge_customer_info(context, extracted_info, "AI")
         
         # Log current state after extraction
-        logger.info(f"[COLLECT_INFO] After AI extraction: name='{context.customer_info.name}', phone='{context.customer_info.phone}', address='{context.customer_info.address}'")
+        logger.info("[COLLECT_INFO] After extraction: name='{}', phone='{}', address='{}'", customer_info.name, customer_info.phone, customer_info.address)
         
         # Check if we have all information
         if context.customer_info.name and context.customer_info.phone and context.customer_info.address:
-            logger.info(f"[COLLECT_INFO] All info collected! Moving to order creation.")
+            logger.info("[COLLECT_INFO] All info collected! Moving to order creation.")
             response_text = "Perfecto. Tengo toda tu información. Voy a procesar tu pedido."
             context.update_state(ConversationState.CREATING_ORDER)
         elif not context.customer_info.name:
@@ -303,21 +626,21 @@ Important: Extract ALL digits from phone numbers regardless of spaces.
         elif not context.customer_info.address:
             response_text = "¿Cuál es tu dirección de entrega?"
         
-        logger.info(f"[COLLECT_INFO] Response: '{response_text}'")
+        logger.info("[COLLECT_INFO] Response: '{}'", response_text)
         return await self._voice_response(response_text)
     
     async def _create_order(self, context: ConversationContext) -> Dict[str, str]:
         """Create the final order"""
         try:
-            logger.info(f"[CREATE_ORDER] Starting order creation")
-            logger.info(f"[CREATE_ORDER] Customer info: name='{context.customer_info.name}', phone='{context.customer_info.phone}', address='{context.customer_info.address}'")
-            logger.info(f"[CREATE_ORDER] Cart token: '{context.cart_token}'")
+            logger.info("[CREATE_ORDER] Starting order creation")
+            logger.info("[CREATE_ORDER] Customer info: name='{}', phone='{}', address='{}'", context.customer_info.name, context.customer_info.phone, context.customer_info.address)
+            logger.info("[CREATE_ORDER] Cart token: '{}'", context.cart_token)
             
             if not context.is_customer_info_complete():
-                logger.error(f"[CREATE_ORDER] Customer info incomplete!")
+                logger.error("[CREATE_ORDER] Customer info incomplete!")
                 return await self._voice_response("Necesito tu información completa para procesar el pedido.")
             
-            logger.info(f"[CREATE_ORDER] Customer info complete, calling pizza_api.create_order")
+            logger.info("[CREATE_ORDER] Customer info complete, calling pizza_api.create_order")
             order_result = await pizza_api.create_order(
                 cart_token=context.cart_token,
                 customer_name=context.customer_info.name,
@@ -326,46 +649,33 @@ Important: Extract ALL digits from phone numbers regardless of spaces.
                 payment_method=context.customer_info.payment_method
             )
             
-            logger.info(f"[CREATE_ORDER] Order result: {order_result}")
+            logger.info("[CREATE_ORDER] Order result: {}", order_result)
             
             if order_result:
                 order_id = order_result["data"]["id"]
                 view_url = order_result.get("view_url", "")
                 
-                response_text = f"""
-                ¡Perfecto! Tu pedido número {order_id} ha sido confirmado.
-                Puedes ver los detalles en: {view_url}
-                Te llegará en aproximadamente 30 minutos.
-                ¡Gracias por elegir Pizza Project!
-                """
+                response_text = _ORDER_CONFIRMED.format(order_id=order_id, view_url=view_url)
                 
                 context.update_state(ConversationState.ORDER_COMPLETE)
+                # Keep the (small) terminal context until the status webhook, but drop the chat history now
+                langchain_service.clear_memory(context.call_sid)
                 return await self._voice_response(response_text, hangup=True)
             else:
+                context.update_state(ConversationState.ERROR)
+                await self.end_conversation(context.call_sid)
                 return await self._error_response("No pude procesar tu pedido. Intenta de nuevo.")
                 
         except Exception as e:
             logger.error(f"Error creating order: {str(e)}")
+            context.update_state(ConversationState.ERROR)
+            await self.end_conversation(context.call_sid)
             return await self._error_response("Hubo un problema al procesar tu pedido.")
     
     async def _voice_response(self, text: str, hangup: bool = False) -> Dict[str, str]:
         """Create voice response with TwiML"""
-        
-        audio_bytes = await polly_service.synthesize_speech(text)
-        
-        if hangup:
-            twiml = f'<Response><Say language="es-ES">{text}</Say><Hangup/></Response>'
-        else:
-            twiml = f'''
-            <Response>
-                <Say language="es-ES">{text}</Say>
-                <Gather input="speech" action="/voice/process-speech" method="POST" 
-                        speechTimeout="3" language="es-ES">
-                </Gather>
-                <Say language="es-ES">No pude escucharte. ¿Puedes repetir?</Say>
-                <Redirect>/voice/incoming</Redirect>
-            </Response>
-            '''
+        # Twilio speaks the text itself via <Say>, so no Polly synthesis is needed here
+        twiml = _twiml(text, hangup)
         
         return {
             "action": "voice_response",
@@ -375,12 +685,7 @@ Important: Extract ALL digits from phone numbers regardless of spaces.
     
     async def _error_response(self, message: str) -> Dict[str, str]:
         """Create error response"""
-        twiml = f'''
-        <Response>
-            <Say language="es-ES">{message}</Say>
-            <Hangup/>
-        </Response>
-        '''
+        twiml = _twiml(message, hangup=True)
         
         return {
             "action": "error",
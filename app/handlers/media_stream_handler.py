@@ -1,55 +1,133 @@
-import json
+import orjson
 import base64
 import asyncio
 from fastapi import WebSocket, WebSocketDisconnect
 from loguru import logger
-from typing import Dict, Optional
+from typing import Coroutine, Dict, FrozenSet, Iterable, Optional, Set, Tuple
 from app.handlers.conversation_manager import conversation_manager
 from app.services.transcribe_service import transcribe_service
 from app.services.polly_service import polly_service
-import tempfile
-import os
-from collections import defaultdict
-import io
-import audioop
-import wave
+from app.utils.mulaw import pcm16_to_ulaw, rms, ulaw_to_pcm16
+import struct
+from dataclasses import dataclass, field
+from enum import Enum
+
+# Twilio sends 20 ms frames of 8 kHz mulaw; an utterance ends after a run of quiet frames
+_FRAME_MS = 20
+_FRAME_BYTES = 160  # 20 ms at 8 kHz, one byte per mulaw sample
+_MAX_UTTERANCE_BYTES = 60 * 8000  # 60 s of mulaw
+_SPEECH_RMS = 500  # 16-bit PCM RMS above which a frame counts as speech
+_MIN_SPEECH_MS = 200
+_END_SILENCE_MS = 300
+
+
+def _wrap_pcm_as_wav(pcm: bytes, sample_rate: int = 8000) -> bytes:
+    """Prefix 16-bit mono PCM with a 44-byte RIFF/WAVE header"""
+    header = struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', 36 + len(pcm), b'WAVE',
+        b'fmt ', 16, 1, 1, sample_rate, sample_rate * 2, 2, 16,
+        b'data', len(pcm)
+    )
+    return header + pcm
+
+
+class _Feed(Enum):
+    """What a frame did to the utterance being endpointed"""
+    CONTINUE = "continue"
+    ENDED = "ended"
+    DISCARDED = "discarded"  # The burst so far was too short to be speech
+
+
+@dataclass(slots=True)
+class _Endpointer:
+    """Per-call speech/silence counters for cutting the stream into utterances"""
+    speech_ms: int = 0
+    silence_ms: int = 0
+    
+    def feed(self, frame: bytes) -> _Feed:
+        """Account for one mulaw frame; reports when an utterance ends or a burst is dropped"""
+        if rms(ulaw_to_pcm16(frame)) >= _SPEECH_RMS:
+            self.speech_ms += _FRAME_MS
+            self.silence_ms = 0
+        elif self.speech_ms:
+            self.silence_ms += _FRAME_MS
+        
+        if self.speech_ms >= _MIN_SPEECH_MS and self.silence_ms >= _END_SILENCE_MS:
+            self.speech_ms = self.silence_ms = 0
+            return _Feed.ENDED
+        if self.speech_ms and self.silence_ms >= _END_SILENCE_MS:
+            # Too short to be speech (a click or a cough); start over
+            self.speech_ms = self.silence_ms = 0
+            return _Feed.DISCARDED
+        return _Feed.CONTINUE
+    
+    @property
+    def in_speech(self) -> bool:
+        return self.speech_ms > 0
+    
+    @property
+    def has_speech(self) -> bool:
+        """Whether the burst in progress is already long enough to be speech"""
+        return self.speech_ms >= _MIN_SPEECH_MS
+
+
+@dataclass(slots=True)
+class CallSession:
+    """Everything the handler keeps for one connected media stream"""
+    call_sid: str
+    websocket: WebSocket
+    stream_sid: Optional[str] = None
+    connected: bool = True
+    buffer: bytearray = field(default_factory=bytearray)
+    endpointer: _Endpointer = field(default_factory=_Endpointer)
+    # Utterances of one call are transcribed and answered in order, one at a time
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    # Greeting and utterance tasks still running, all cancelled when the stream closes
+    turn_tasks: Set[asyncio.Task] = field(default_factory=set)
+    # Outbound media messages, drained by the session's sender task
+    send_queue: asyncio.Queue = field(default_factory=asyncio.Queue)
 
 
 class MediaStreamHandler:
     """Handles Twilio Media Streams WebSocket connections for real-time audio"""
     
     def __init__(self):
-        self.active_streams: Dict[str, Dict] = {}
-        self.audio_buffers: Dict[str, io.BytesIO] = defaultdict(io.BytesIO)
-        self.stream_sids: Dict[str, str] = {}  # call_sid -> stream_sid mapping
+        self.sessions: Dict[str, CallSession] = {}
+        # Encoded frames of the fixed prompts by text; they repeat on every call
+        self.payload_cache: Dict[str, Tuple[str, ...]] = {}
+        # Same rule as the Polly cache: only the prompts given to prewarm are kept
+        self._cacheable_texts: FrozenSet[str] = frozenset()
+    
+    async def prewarm(self, texts: Iterable[str]):
+        """Encode fixed prompts ahead of time so calls send them straight from the cache"""
+        texts = tuple(texts)
+        self._cacheable_texts |= frozenset(texts)
+        await asyncio.gather(*(self._encode_response_audio(text) for text in texts))
+        logger.info(f"Media stream cache pre-warmed with {len(self.payload_cache)} prompts")
         
     async def handle_websocket(self, websocket: WebSocket, call_sid: str):
         """Handle WebSocket connection for media streaming"""
         await websocket.accept()
         logger.info(f"WebSocket connected for call: {call_sid}")
         
-        # Initialize stream data  
-        self.active_streams[call_sid] = {
-            "websocket": websocket,
-            "call_sid": call_sid,
-            "connected": True
-        }
+        # Initialize stream data
+        session = CallSession(call_sid=call_sid, websocket=websocket)
+        self.sessions[call_sid] = session
+        sender = asyncio.create_task(self._send_loop(session))
         
         try:
-            # Send initial greeting
-            await self._send_initial_greeting(call_sid)
-            
             # Process incoming messages
             while True:
                 try:
                     data = await websocket.receive_text()
-                    message = json.loads(data)
-                    await self._process_media_message(call_sid, message)
+                    message = orjson.loads(data)
+                    await self._process_media_message(session, message)
                     
                 except WebSocketDisconnect:
                     logger.info(f"WebSocket disconnected for call: {call_sid}")
                     break
-                except json.JSONDecodeError:
+                except orjson.JSONDecodeError:
                     logger.warning(f"Invalid JSON received from call {call_sid}")
                 except Exception as e:
                     logger.error(f"Error processing message for call {call_sid}: {str(e)}")
@@ -58,19 +136,42 @@ class MediaStreamHandler:
             logger.error(f"WebSocket error for call {call_sid}: {str(e)}")
         finally:
             # Cleanup
+            sender.cancel()
             await self._cleanup_stream(call_sid)
+    
+    async def _send_loop(self, session: CallSession):
+        """Send queued media messages in order, so replies are produced independently of the network"""
+        while True:
+            message = await session.send_queue.get()
+            try:
+                await session.websocket.send_text(message)
+            except Exception as e:
+                logger.error(f"Error sending media to call {session.call_sid}: {str(e)}")
+                # Nothing more can reach the caller; stop replies from queueing behind it
+                session.connected = False
+                return
+    
+    @staticmethod
+    def _start_turn(session: CallSession, coro: Coroutine):
+        """Run a greeting or utterance in the background, tracked for cleanup"""
+        task = asyncio.create_task(coro)
+        session.turn_tasks.add(task)
+        task.add_done_callback(session.turn_tasks.discard)
             
-    async def _process_media_message(self, call_sid: str, message: dict):
+    async def _process_media_message(self, session: CallSession, message: dict):
         """Process incoming media stream messages"""
+        call_sid = session.call_sid
         event = message.get("event")
         
         if event == "connected":
             logger.info(f"Media stream connected for call: {call_sid}")
             
         elif event == "start":
-            stream_sid = message.get("streamSid")
-            self.stream_sids[call_sid] = stream_sid
-            logger.info(f"Media stream started: {stream_sid} for call: {call_sid}")
+            session.stream_sid = message.get("streamSid")
+            logger.info(f"Media stream started: {session.stream_sid} for call: {call_sid}")
+            # The greeting needs the stream SID; send it in the background so the caller's
+            # frames keep being processed instead of queueing behind its synthesis
+            self._start_turn(session, self._send_initial_greeting(session))
             
         elif event == "media":
             # Accumulate audio data
@@ -81,142 +182,160 @@ class MediaStreamHandler:
                 # Decode base64 audio (mulaw format)
                 try:
                     decoded_audio = base64.b64decode(audio_data)
-                    self.audio_buffers[call_sid].write(decoded_audio)
                 except Exception as e:
                     logger.error(f"Error decoding audio for call {call_sid}: {str(e)}")
+                    return
+                
+                result = session.endpointer.feed(decoded_audio)
+                if result is _Feed.DISCARDED:
+                    # The noise must not be prepended to the next utterance
+                    session.buffer.clear()
+                    return
+                # Silence before speech starts is not buffered
+                utterance_ended = result is _Feed.ENDED
+                if session.endpointer.in_speech or utterance_ended:
+                    session.buffer += decoded_audio
+                if len(session.buffer) >= _MAX_UTTERANCE_BYTES:
+                    # Someone talking without pause: transcribe what we have rather than grow unbounded
+                    session.endpointer = _Endpointer()
+                    utterance_ended = True
+                if utterance_ended:
+                    # Transcribe in the background so the receive loop keeps capturing the caller
+                    audio_data = self._take_utterance(session)
+                    if audio_data:
+                        self._start_turn(session, self._process_accumulated_audio(session, audio_data))
                     
         elif event == "stop":
             logger.info(f"Media stream stopped for call: {call_sid}")
-            # Process accumulated audio
-            await self._process_accumulated_audio(call_sid)
+            # A burst still too short to be speech is noise; Whisper would invent text for it
+            if not session.endpointer.has_speech:
+                session.buffer.clear()
+            audio_data = self._take_utterance(session)
+            if audio_data:
+                await self._process_accumulated_audio(session, audio_data)
+    
+    @staticmethod
+    def _take_utterance(session: CallSession) -> Optional[bytes]:
+        """Take the buffered utterance; audio arriving while earlier turns finish belongs to the next one"""
+        if not session.buffer:
+            logger.warning(f"No audio data to process for call: {session.call_sid}")
+            return None
+        audio_data = bytes(session.buffer)
+        session.buffer.clear()
+        return audio_data
             
-    async def _process_accumulated_audio(self, call_sid: str):
-        """Process accumulated audio buffer using Whisper"""
+    async def _process_accumulated_audio(self, session: CallSession, audio_data: bytes):
+        """Process one utterance using Whisper"""
+        async with session.lock:
+            await self._transcribe_and_respond(session, audio_data)
+    
+    async def _transcribe_and_respond(self, session: CallSession, audio_data: bytes):
+        """Transcribe one utterance and answer it"""
+        call_sid = session.call_sid
         try:
-            audio_buffer = self.audio_buffers.get(call_sid)
-            if not audio_buffer or audio_buffer.tell() == 0:
-                logger.warning(f"No audio data to process for call: {call_sid}")
-                return
-                
-            # Reset buffer position to beginning
-            audio_buffer.seek(0)
-            audio_data = audio_buffer.read()
-            
-            # Clear buffer for next chunk
-            self.audio_buffers[call_sid] = io.BytesIO()
-            
             # Convert mulaw to PCM WAV format
             # Twilio sends mulaw at 8kHz, 8-bit
             try:
-                # Convert mulaw to 16-bit PCM
-                pcm_data = audioop.ulaw2lin(audio_data, 2)
-                
-                # Create WAV file
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as temp_file:
-                    temp_file_path = temp_file.name
-                    
-                with wave.open(temp_file_path, 'wb') as wav_file:
-                    wav_file.setnchannels(1)  # Mono
-                    wav_file.setsampwidth(2)  # 16-bit
-                    wav_file.setframerate(8000)  # 8kHz sample rate
-                    wav_file.writeframes(pcm_data)
+                # Convert mulaw to 16-bit PCM and wrap it as an in-memory WAV (no temp file)
+                wav_audio = _wrap_pcm_as_wav(ulaw_to_pcm16(audio_data).tobytes())
                     
             except Exception as e:
                 logger.error(f"Error converting audio format for call {call_sid}: {str(e)}")
                 return
                 
-            try:
-                # Transcribe with Whisper
-                with open(temp_file_path, 'rb') as audio_file:
-                    from openai import OpenAI
-                    from app.config.settings import settings
-                    
-                    client = OpenAI(api_key=settings.openai_api_key)
-                    transcript = client.audio.transcriptions.create(
-                        model="whisper-1",
-                        file=audio_file,
-                        language="es"
-                    )
-                    
-                transcribed_text = transcript.text.strip()
-                logger.info(f"Whisper transcription for {call_sid}: '{transcribed_text}'")
+            # Whisper, under the same concurrency cap as recording transcriptions
+            transcribed_text = await transcribe_service.transcribe_wav(wav_audio, "es")
+            logger.info(f"Whisper transcription for {call_sid}: '{transcribed_text}'")
+            
+            if transcribed_text:
+                # Process with conversation manager
+                result = await conversation_manager.process_customer_message(
+                    call_sid, 
+                    transcribed_text
+                )
                 
-                if transcribed_text:
-                    # Process with conversation manager
-                    result = await conversation_manager.process_customer_message(
-                        call_sid, 
-                        transcribed_text
-                    )
-                    
-                    # Send audio response back via WebSocket
-                    response_text = result.get("message", "")
-                    await self._send_audio_response(call_sid, response_text)
-                    
-            finally:
-                # Clean up temp file
-                os.unlink(temp_file_path)
+                # Send audio response back via WebSocket
+                response_text = result.get("message", "")
+                await self._send_audio_response(session, response_text)
                 
         except Exception as e:
             logger.error(f"Error processing accumulated audio for call {call_sid}: {str(e)}")
             
-    async def _send_initial_greeting(self, call_sid: str):
+    async def _send_initial_greeting(self, session: CallSession):
         """Send initial greeting via WebSocket"""
         greeting = "¡Hola! Bienvenido a Pizza Project. ¿Qué desea ordenar hoy?"
-        await self._send_audio_response(call_sid, greeting)
+        # Under the turn lock so an answer to an early utterance can't play before it
+        async with session.lock:
+            await self._send_audio_response(session, greeting)
         
-    async def _send_audio_response(self, call_sid: str, text: str):
+    async def _send_audio_response(self, session: CallSession, text: str):
         """Send audio response via WebSocket"""
+        call_sid = session.call_sid
         try:
-            stream_data = self.active_streams.get(call_sid)
-            if not stream_data or not stream_data.get("connected"):
+            if not session.connected:
                 logger.warning(f"No active stream for call: {call_sid}")
                 return
                 
-            websocket = stream_data["websocket"]
-            stream_sid = self.stream_sids.get(call_sid)
-            
-            if not stream_sid:
+            if not session.stream_sid:
                 logger.warning(f"No stream SID for call: {call_sid}")
                 return
                 
-            # Generate audio with Polly (returns PCM WAV)
-            audio_bytes = await polly_service.synthesize_speech(text)
-            
-            # Convert PCM to mulaw for Twilio
-            # Assuming Polly returns 16-bit PCM at 22kHz, we need to convert to 8kHz mulaw
-            try:
-                # Convert 16-bit PCM to mulaw (simplified - may need proper resampling)
-                mulaw_data = audioop.lin2ulaw(audio_bytes, 2)
-                audio_base64 = base64.b64encode(mulaw_data).decode('utf-8')
-            except Exception as e:
-                logger.error(f"Error converting response audio to mulaw: {str(e)}")
+            frames = await self._encode_response_audio(text)
+            if frames is None:
+                return
+            if not session.connected:
+                # The stream closed or a send failed during synthesis
                 return
             
-            # Send audio via WebSocket
-            media_message = {
-                "event": "media",
-                "streamSid": stream_sid,
-                "media": {
-                    "payload": audio_base64
+            # One 20 ms media message per frame, as Twilio streams them
+            for payload in frames:
+                media_message = {
+                    "event": "media",
+                    "streamSid": session.stream_sid,
+                    "media": {
+                        "payload": payload
+                    }
                 }
-            }
-            
-            await websocket.send_text(json.dumps(media_message))
-            logger.info(f"Sent audio response to call: {call_sid}")
+                session.send_queue.put_nowait(orjson.dumps(media_message).decode())
+            logger.info(f"Queued {len(frames)} audio frames for call: {call_sid}")
             
         except Exception as e:
             logger.error(f"Error sending audio response to call {call_sid}: {str(e)}")
             
+    async def _encode_response_audio(self, text: str) -> Optional[Tuple[str, ...]]:
+        """Synthesize text as base64 mulaw frames; fixed prompts come from the cache"""
+        cached = self.payload_cache.get(text)
+        if cached is not None:
+            return cached
+        
+        # Polly renders raw 16-bit PCM at Twilio's 8 kHz, so no resampling is needed
+        audio_bytes = await polly_service.synthesize_speech(text, output_format="pcm", sample_rate="8000")
+        if not audio_bytes:
+            return None
+        
+        # Convert PCM to mulaw for Twilio
+        try:
+            mulaw_data = pcm16_to_ulaw(audio_bytes)
+            frames = tuple(
+                base64.b64encode(mulaw_data[i:i + _FRAME_BYTES]).decode('ascii')
+                for i in range(0, len(mulaw_data), _FRAME_BYTES)
+            )
+        except Exception as e:
+            logger.error(f"Error converting response audio to mulaw: {str(e)}")
+            return None
+        
+        if text in self._cacheable_texts:
+            self.payload_cache[text] = frames
+        return frames
+    
     async def _cleanup_stream(self, call_sid: str):
         """Clean up stream resources"""
-        if call_sid in self.active_streams:
-            del self.active_streams[call_sid]
-        if call_sid in self.audio_buffers:
-            del self.audio_buffers[call_sid]
-        if call_sid in self.stream_sids:
-            del self.stream_sids[call_sid]
+        session = self.sessions.pop(call_sid, None)
+        if session is not None:
+            session.connected = False
+            for task in list(session.turn_tasks):
+                task.cancel()
         logger.info(f"Cleaned up stream resources for call: {call_sid}")
 
-
 # Global handler instance
 media_stream_handler = MediaStreamHandler()
\ No newline at end of file
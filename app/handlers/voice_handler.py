@@ -4,12 +4,30 @@ from twilio.twiml.voice_response import VoiceResponse, Start
 from loguru import logger
 from typing import Optional
 from app.handlers.conversation_manager import conversation_manager
-from app.services.langchain_service import langchain_service
 from app.services.transcribe_service import transcribe_service
 from app.handlers.media_stream_handler import media_stream_handler
 
 voice_router = APIRouter()
 
+def _static_twiml(message: str, redirect: bool = False) -> str:
+    """Build a fixed TwiML reply that says message, then redirects or hangs up"""
+    response = VoiceResponse()
+    response.say(message, language='es-ES')
+    if redirect:
+        response.redirect('/voice/incoming')
+    else:
+        response.hangup()
+    return str(response)
+
+# Fallback replies never change, so their XML is built once at import
+_TECHNICAL_PROBLEMS_TWIML = _static_twiml("Disculpa, tenemos problemas técnicos. Intenta más tarde.")
+_NOT_UNDERSTOOD_TWIML = _static_twiml("No pude entender lo que dijiste. ¿Puedes repetir?", redirect=True)
+_SPEECH_ERROR_TWIML = _static_twiml("Hubo un error procesando tu solicitud. Por favor, intenta de nuevo.")
+_NO_RECORDING_TWIML = _static_twiml("No pude recibir tu grabación. ¿Puedes repetir?", redirect=True)
+_RECORDING_ERROR_TWIML = _static_twiml("Hubo un error procesando tu grabación. Por favor, intenta de nuevo.")
+
+_FINAL_CALL_STATUSES = frozenset({"completed", "busy", "no-answer", "failed", "canceled"})
+
 @voice_router.post("/incoming")
 async def handle_incoming_call(request: Request):
     """Handle incoming Twilio voice calls"""
@@ -28,13 +46,7 @@ async def handle_incoming_call(request: Request):
         
     except Exception as e:
         logger.error(f"Error handling incoming call: {str(e)}")
-        
-        response = VoiceResponse()
-        response.say("Disculpa, tenemos problemas técnicos. Intenta más tarde.", 
-                    language='es-ES')
-        response.hangup()
-        
-        return Response(content=str(response), media_type="application/xml")
+        return Response(content=_TECHNICAL_PROBLEMS_TWIML, media_type="application/xml")
 
 @voice_router.post("/process-speech")
 async def process_speech(
@@ -49,12 +61,7 @@ async def process_speech(
         
         if not SpeechResult or not CallSid:
             logger.warning("Missing speech result or call SID")
-            
-            response = VoiceResponse()
-            response.say("No pude entender lo que dijiste. ¿Puedes repetir?", 
-                        language='es-ES')
-            response.redirect('/voice/incoming')
-            return Response(content=str(response), media_type="application/xml")
+            return Response(content=_NOT_UNDERSTOOD_TWIML, media_type="application/xml")
         
         result = await conversation_manager.process_customer_message(
             CallSid, 
@@ -65,12 +72,7 @@ async def process_speech(
         
     except Exception as e:
         logger.error(f"Error processing speech: {str(e)}")
-        
-        response = VoiceResponse()
-        response.say("Hubo un error procesando tu solicitud. Por favor, intenta de nuevo.", 
-                    language='es-ES')
-        response.hangup()
-        return Response(content=str(response), media_type="application/xml")
+        return Response(content=_SPEECH_ERROR_TWIML, media_type="application/xml")
 
 @voice_router.websocket("/media-stream/{call_sid}")
 async def websocket_media_stream(websocket: WebSocket, call_sid: str):
@@ -89,24 +91,14 @@ async def process_recording(
         
         if not RecordingUrl or not CallSid:
             logger.warning("Missing recording URL or call SID")
-            
-            response = VoiceResponse()
-            response.say("No pude recibir tu grabación. ¿Puedes repetir?", 
-                        language='es-ES')
-            response.redirect('/voice/incoming')
-            return Response(content=str(response), media_type="application/xml")
+            return Response(content=_NO_RECORDING_TWIML, media_type="application/xml")
         
         # Transcribe with Whisper
         transcribed_text = await transcribe_service.transcribe_audio_from_url(RecordingUrl)
         
         if not transcribed_text:
             logger.warning("Failed to transcribe audio")
-            
-            response = VoiceResponse()
-            response.say("No pude entender lo que dijiste. ¿Puedes repetir?", 
-                        language='es-ES')
-            response.redirect('/voice/incoming')
-            return Response(content=str(response), media_type="application/xml")
+            return Response(content=_NOT_UNDERSTOOD_TWIML, media_type="application/xml")
         
         # Process the transcribed text
         result = await conversation_manager.process_customer_message(
@@ -118,22 +110,16 @@ async def process_recording(
         
     except Exception as e:
         logger.error(f"Error processing recording: {str(e)}")
-        
-        response = VoiceResponse()
-        response.say("Hubo un error procesando tu grabación. Por favor, intenta de nuevo.", 
-                    language='es-ES')
-        response.hangup()
-        return Response(content=str(response), media_type="application/xml")
+        return Response(content=_RECORDING_ERROR_TWIML, media_type="application/xml")
 
 @voice_router.post("/recording-status")
-async def recording_status(request: Request):
+async def recording_status(
+    RecordingStatus: Optional[str] = Form(None),
+    CallSid: Optional[str] = Form(None)
+):
     """Handle recording status updates"""
     try:
-        form_data = await request.form()
-        recording_status = form_data.get("RecordingStatus")
-        call_sid = form_data.get("CallSid")
-        
-        logger.info(f"Recording {call_sid} status: {recording_status}")
+        logger.info(f"Recording {CallSid} status: {RecordingStatus}")
         return {"status": "received"}
         
     except Exception as e:
@@ -141,20 +127,16 @@ async def recording_status(request: Request):
         return {"status": "error"}
 
 @voice_router.post("/status")
-async def call_status(request: Request):
+async def call_status(
+    CallStatus: Optional[str] = Form(None),
+    CallSid: Optional[str] = Form(None)
+):
     """Handle call status updates from Twilio"""
     try:
-        form_data = await request.form()
-        call_status = form_data.get("CallStatus")
-        call_sid = form_data.get("CallSid")
-        
-        logger.info(f"Call {call_sid} status: {call_status}")
+        logger.info(f"Call {CallSid} status: {CallStatus}")
         
-        if call_status in ["completed", "busy", "no-answer", "failed", "canceled"]:
-            if call_sid in conversation_manager.active_conversations:
-                del conversation_manager.active_conversations[call_sid]
-                langchain_service.clear_memory(call_sid)
-                logger.info(f"Cleaned up conversation for {call_sid}")
+        if CallSid and CallStatus in _FINAL_CALL_STATUSES:
+            await conversation_manager.end_conversation(CallSid)
         
         return {"status": "received"}
         
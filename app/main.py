@@ -1,22 +1,69 @@
-from fastapi import FastAPI, Request
-from fastapi.responses import PlainTextResponse
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import ORJSONResponse, PlainTextResponse
 from loguru import logger
+import asyncio
+import random
+import secrets
 import sys
+import time
+from typing import Optional
 
 from app.config.settings import settings
 from app.handlers.voice_handler import voice_router
+from app.services.catalog_cache import catalog_cache
+from app.services.langchain_service import langchain_service
+from app.services.polly_service import polly_service
+from app.services.pizza_api_service import pizza_api
+from app.services.openai_client import openai_client
+from app.services.transcribe_service import transcribe_service
+from app.handlers.conversation_manager import CANNED_PROMPTS, conversation_manager
+from app.handlers.media_stream_handler import media_stream_handler
 
 logger.remove()
-logger.add(sys.stdout, level=settings.log_level)
+# enqueue moves sink I/O off the event loop; JSON records carry bound extras such as call_sid
+logger.add(
+    sys.stdout,
+    level=settings.log_level,
+    enqueue=True,
+    serialize=settings.app_env != "development"
+)
 
 app = FastAPI(
     title="Pizza AI Voice Agent",
     description="AI-powered voice agent for pizza orders using AWS and Twilio",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 app.include_router(voice_router, prefix="/voice", tags=["voice"])
 
+async def _prewarm_prompts():
+    """Synthesize the fixed prompts, then encode them as media stream frames"""
+    await polly_service.prewarm(CANNED_PROMPTS)
+    await media_stream_handler.prewarm(CANNED_PROMPTS)
+
+async def _prewarm_catalog():
+    """Load the catalog and render its prompt so no turn pays for either"""
+    catalog = await catalog_cache.get()
+    if catalog:
+        langchain_service.prepare_catalog(catalog, catalog_cache.version)
+
+@app.on_event("startup")
+async def prewarm_caches():
+    """Pre-synthesize fixed prompts and load the catalog so the first calls skip both"""
+    # In the background: startup (and Twilio's first webhooks) shouldn't wait on TTS
+    app.state.prewarm_task = asyncio.create_task(_prewarm_prompts())
+    # Also opens the first pooled Laravel connection (DNS + TLS) before any call needs it
+    app.state.catalog_task = asyncio.create_task(_prewarm_catalog())
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    """Close pooled HTTP and Redis connections"""
+    await pizza_api.aclose()
+    await openai_client.close()
+    await transcribe_service.aclose()
+    await conversation_manager.active_conversations.aclose()
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -41,12 +88,33 @@ async def health_check():
     
     return health_status
 
+@app.post("/admin/catalog/invalidate")
+async def invalidate_catalog(x_admin_token: Optional[str] = Header(default=None)):
+    """Force the shared catalog cache to refetch on next access"""
+    # Same public server as the Twilio webhooks, so only callers holding the shared secret
+    if not settings.admin_token or not x_admin_token or not secrets.compare_digest(
+        x_admin_token.encode(), settings.admin_token.encode()
+    ):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    catalog_cache.invalidate()
+    return {"status": "invalidated"}
+
+# Probes hit these constantly and say nothing about calls
+_UNLOGGED_PATHS = frozenset({"/", "/health"})
+
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    """Log all incoming requests"""
-    logger.info(f"Incoming request: {request.method} {request.url}")
+    """Log a sample of requests, one line each; failures are always logged"""
+    started = time.perf_counter()
     response = await call_next(request)
-    logger.info(f"Response status: {response.status_code}")
+    if request.url.path in _UNLOGGED_PATHS:
+        return response
+    if response.status_code >= 400 or random.random() < settings.request_log_sample_rate:
+        logger.info(
+            "{} {} -> {} ({:.0f} ms)",
+            request.method, request.url.path, response.status_code,
+            (time.perf_counter() - started) * 1000
+        )
     return response
 
 if __name__ == "__main__":
@@ -1,8 +1,8 @@
-from pydantic import BaseModel
+from dataclasses import dataclass, field
 from typing import Optional, Dict, List, Any
-from enum import Enum
+from enum import StrEnum
 
-class ConversationState(str, Enum):
+class ConversationState(StrEnum):
     WELCOME = "welcome"
     TAKING_ORDER = "taking_order"
     CONFIRMING_CART = "confirming_cart"
@@ -11,21 +11,24 @@ class ConversationState(str, Enum):
     ORDER_COMPLETE = "order_complete"
     ERROR = "error"
 
-class CustomerInfo(BaseModel):
+# Slotted dataclasses: one instance of each lives per active call, so no per-instance __dict__
+@dataclass(slots=True)
+class CustomerInfo:
     name: Optional[str] = None
     phone: Optional[str] = None
     address: Optional[str] = None
     payment_method: str = "efectivo"
 
-class ConversationContext(BaseModel):
+@dataclass(slots=True)
+class ConversationContext:
     call_sid: Optional[str] = None
     state: ConversationState = ConversationState.WELCOME
     cart_token: Optional[str] = None
-    customer_info: CustomerInfo = CustomerInfo()
-    conversation_history: List[Dict[str, str]] = []
-    catalog: Optional[Dict] = None
+    customer_info: CustomerInfo = field(default_factory=CustomerInfo)
+    conversation_history: List[Dict[str, str]] = field(default_factory=list)
     last_customer_message: Optional[str] = None
     attempts: int = 0  # Track clarification attempts
+    cart_item_count: int = 0  # Items successfully added to the cart this call
     
     def update_state(self, new_state: ConversationState):
         """Update conversation state"""
@@ -38,6 +41,19 @@ class ConversationContext(BaseModel):
             "content": content
         })
     
+    def apply_updates(self, updates: Dict[str, Any], history_limit: Optional[int] = None):
+        """Apply a turn's changes in place (new messages, state, attempts, customer info)"""
+        for message in updates.get("messages", []):
+            self.add_message(message["role"], message["content"])
+        if history_limit is not None and len(self.conversation_history) > history_limit:
+            del self.conversation_history[:-history_limit]
+        if "state" in updates:
+            self.state = ConversationState(updates["state"])
+        if "attempts" in updates:
+            self.attempts = updates["attempts"]
+        for field, value in updates.get("customer_info", {}).items():
+            setattr(self.customer_info, field, value)
+    
     def is_customer_info_complete(self) -> bool:
         """Check if all required customer info is collected"""
         return bool(
@@ -53,28 +69,3 @@ class ConversationContext(BaseModel):
     def increment_attempts(self):
         """Increment clarification attempts"""
         self.attempts += 1
-    
-    def to_dict(self) -> Dict[str, Any]:
-        """Convert to dictionary for serialization"""
-        return {
-            "call_sid": self.call_sid,
-            "state": self.state.value,
-            "cart_token": self.cart_token,
-            "customer_info": self.customer_info.model_dump(),
-            "conversation_history": self.conversation_history,
-            "last_customer_message": self.last_customer_message,
-            "attempts": self.attempts
-        }
-    
-    @classmethod
-    def from_dict(cls, data: Dict[str, Any]) -> "ConversationContext":
-        """Create from dictionary"""
-        context = cls()
-        context.call_sid = data.get("call_sid")
-        context.state = ConversationState(data.get("state", "welcome"))
-        context.cart_token = data.get("cart_token")
-        context.customer_info = CustomerInfo(**data.get("customer_info", {}))
-        context.conversation_history = data.get("conversation_history", [])
-        context.last_customer_message = data.get("last_customer_message")
-        context.attempts = data.get("attempts", 0)
-        return context
\ No newline at end of file
@@ -1,7 +1,12 @@
 import boto3
+import threading
+from botocore.config import Config
 from app.config.settings import settings
 from loguru import logger
 
+# Clients are shared by concurrent worker threads; botocore's default pool is 10 connections
+_CLIENT_CONFIG = Config(max_pool_connections=50)
+
 class AWSConfig:
     """AWS services configuration and clients"""
     
@@ -11,18 +16,32 @@ class AWSConfig:
             aws_secret_access_key=settings.aws_secret_access_key,
             region_name=settings.aws_region
         )
+        # One client per service: building one loads service models and endpoint rules
+        self._clients = {}
+        # First use may come from several worker threads at once
+        self._clients_lock = threading.Lock()
         logger.info(f"AWS session initialized for region: {settings.aws_region}")
     
+    def _client(self, service: str):
+        """Get the shared client for service, creating it on first use"""
+        client = self._clients.get(service)
+        if client is None:
+            with self._clients_lock:
+                client = self._clients.get(service)
+                if client is None:
+                    client = self._clients[service] = self.session.client(service, config=_CLIENT_CONFIG)
+        return client
+    
     def get_transcribe_client(self):
         """Get Amazon Transcribe client"""
-        return self.session.client('transcribe')
+        return self._client('transcribe')
     
     def get_polly_client(self):
         """Get Amazon Polly client"""
-        return self.session.client('polly')
+        return self._client('polly')
     
     def get_s3_client(self):
         """Get S3 client for storing audio files"""
-        return self.session.client('s3')
+        return self._client('s3')
 
-aws_config = AWSConfig()
\ No newline at end of file
+aws_config = AWSConfig()
@@ -0,0 +1,188 @@
+import asyncio
+import difflib
+import hashlib
+import re
+import orjson
+import time
+import unicodedata
+from loguru import logger
+from app.config.settings import settings
+from app.services.pizza_api_service import pizza_api
+from app.utils.fuzzy import closest_word
+from typing import Optional, Dict, List
+
+def _fold(text: str) -> str:
+    """Lowercase text without accents"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+def normalize_name(name: str) -> str:
+    """Normalize a product/size name for lookups: no accents, case or spaces"""
+    return "".join(_fold(name).split())
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+# Words that appear in many product names (or in any sentence) and identify nothing
+_GENERIC_TOKENS = frozenset({"pizza", "pizzas", "con", "sin", "los", "las", "una", "uno", "del"})
+
+def name_tokens(text: str) -> List[str]:
+    """Distinctive words of a name or utterance, normalized like the index keys"""
+    return [
+        token for token in _TOKEN_RE.findall(_fold(text))
+        if len(token) >= 3 and token not in _GENERIC_TOKENS
+    ]
+
+class CatalogCache:
+    """Process-wide TTL cache for the pizza catalog shared by all conversations"""
+    
+    def __init__(self, ttl_seconds: int = settings.catalog_cache_ttl_seconds):
+        self.ttl_seconds = ttl_seconds
+        self._catalog: Optional[Dict] = None
+        self._fetched_at: float = 0.0
+        self._lock = asyncio.Lock()
+        self._product_index: Dict[str, Dict] = {}
+        self._size_index: Dict[str, Dict] = {}
+        self._size_word_index: Dict[str, Dict] = {}
+        self._token_index: Dict[str, Dict] = {}
+        # Content hash of the current catalog, for cache keys that must change with the menu
+        self.version: Optional[str] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._etag: Optional[str] = None
+    
+    def _is_fresh(self) -> bool:
+        """Check if the cached catalog is still within its TTL"""
+        return (
+            self._catalog is not None and
+            time.monotonic() - self._fetched_at < self.ttl_seconds
+        )
+    
+    async def get(self) -> Optional[Dict]:
+        """Get the catalog; once expired, serve the stale copy while refreshing in background"""
+        if self._is_fresh():
+            return self._catalog
+        
+        if self._catalog is not None:
+            if self._refresh_task is None or self._refresh_task.done():
+                self._refresh_task = asyncio.create_task(self._refresh())
+            return self._catalog
+        
+        # Cold start: nothing to serve yet, so wait for the fetch
+        await self._refresh()
+        return self._catalog
+    
+    async def _refresh(self):
+        """Fetch the catalog from the API and rebuild the indexes"""
+        async with self._lock:
+            # Another coroutine may have refreshed while we waited
+            if self._is_fresh():
+                return
+            
+            # Conditional once we hold a copy: an unchanged menu comes back as a bodyless 304
+            catalog, etag = await pizza_api.get_catalog(self._etag if self._catalog else None)
+            if catalog is None and etag is not None and self._catalog is not None:
+                self._fetched_at = time.monotonic()
+                logger.info("Catalog unchanged, ttl extended")
+            elif catalog:
+                self._etag = etag
+                self._build_indexes(catalog)
+                self._catalog = catalog
+                self._fetched_at = time.monotonic()
+                self.version = hashlib.sha1(
+                    orjson.dumps(catalog, option=orjson.OPT_SORT_KEYS)
+                ).hexdigest()
+                logger.info(f"Catalog cache refreshed (version: {self.version[:12]}, ttl: {self.ttl_seconds}s)")
+            elif self._catalog:
+                logger.warning("Catalog refresh failed, serving stale catalog")
+    
+    def _build_indexes(self, catalog: Dict):
+        """Index products and sizes by normalized name once per fetch"""
+        data = catalog.get('data', {})
+        product_index: Dict[str, Dict] = {}
+        # Word -> product, for utterances that name a product inside a longer phrase
+        token_index: Dict[str, Dict] = {}
+        shared_tokens = set()
+        for product in data.get('products', []):
+            product_index.setdefault(normalize_name(product['name']), product)
+            for token in name_tokens(product['name']):
+                if token_index.setdefault(token, product) is not product:
+                    shared_tokens.add(token)
+        # A word shared by several products can't pick one
+        for token in shared_tokens:
+            del token_index[token]
+        pizza_sizes = pizza_api.get_pizza_sizes(catalog)
+        size_index: Dict[str, Dict] = {}
+        size_word_index: Dict[str, Dict] = {}
+        for size in pizza_sizes:
+            size_index.setdefault(normalize_name(size['name']), size)
+            # Leading word ("mediana" in "Mediana (10 pulgadas)") for fuzzy matching of spoken sizes
+            words = size['name'].split()
+            if words:
+                size_word_index.setdefault(normalize_name(words[0]), size)
+        self._product_index = product_index
+        self._size_index = size_index
+        self._size_word_index = size_word_index
+        self._token_index = token_index
+    
+    async def find_product(self, product_name: str) -> Optional[Dict]:
+        """Find product by name: exact index hit, partial or close match, word or close word, then term scan"""
+        catalog = await self.get()
+        if not catalog:
+            return None
+        
+        key = normalize_name(product_name)
+        if not key:
+            return None
+        product = self._product_index.get(key)
+        if product is None:
+            # Partial names like "margarita" for "Pizza Margarita", on the prebuilt keys
+            product = next(
+                (candidate for product_key, candidate in self._product_index.items() if key in product_key),
+                None
+            )
+        if product is None:
+            matches = difflib.get_close_matches(key, self._product_index.keys(), n=1, cutoff=0.8)
+            if matches:
+                product = self._product_index[matches[0]]
+        if product is None:
+            # "una hawaiana grande": a distinctive word of exactly one product
+            tokens = name_tokens(product_name)
+            product = next(
+                (self._token_index[token] for token in tokens if token in self._token_index),
+                None
+            )
+            # Then the same words with transcription typos ("margerita", "hawayana")
+            for token in tokens if product is None else ():
+                match = closest_word(token, self._token_index.keys(), k=1 if len(token) <= 5 else 2)
+                if match is not None:
+                    product = self._token_index[match]
+                    break
+        if product is None:
+            # Last resort: the API service's pizza/beverage term matching
+            product = await pizza_api.find_product_by_name(product_name, catalog)
+        return product
+    
+    def find_size(self, size_name: str) -> Optional[Dict]:
+        """Find pizza size by name in the loaded catalog"""
+        key = normalize_name(size_name)
+        if not key:
+            return None
+        size = self._size_index.get(key)
+        if size is None:
+            # Partial names like "grande" for "Grande (12 pulgadas)"
+            for size_key, candidate in self._size_index.items():
+                if key in size_key:
+                    return candidate
+            # Transcription variants like "mediano" or "media" for "Mediana"
+            matches = difflib.get_close_matches(key, self._size_word_index.keys(), n=1, cutoff=0.75)
+            if matches:
+                size = self._size_word_index[matches[0]]
+        return size
+    
+    def invalidate(self):
+        """Drop the cached catalog so the next access refetches it"""
+        self._catalog = None
+        self._fetched_at = 0.0
+        self.version = None
+        self._etag = None
+        logger.info("Catalog cache invalidated")
+
+catalog_cache = CatalogCache()
\ No newline at end of file
@@ -0,0 +1,64 @@
+import orjson
+from loguru import logger
+from app.config.settings import settings
+from app.models.conversation import ConversationContext
+from app.utils.ttl_cache import TTLCache
+from pydantic import TypeAdapter
+from typing import Optional
+
+# orjson serializes the dataclasses natively and pydantic-core rebuilds them (nested
+# CustomerInfo, state enum) straight from the JSON bytes; no hand-built dicts either way
+_CONTEXT_ADAPTER = TypeAdapter(ConversationContext)
+
+class ConversationStore:
+    """Conversation state store: in-process LRU, or Redis when REDIS_URL is set"""
+    
+    def __init__(self, redis_url: Optional[str] = settings.redis_url):
+        self.ttl_seconds = settings.call_idle_ttl_seconds
+        # Bounded so calls whose status webhook never arrives can't leak
+        self._local = TTLCache(
+            maxsize=settings.max_active_calls,
+            ttl=self.ttl_seconds,
+            name="active_conversations"
+        )
+        self._redis = None
+        if redis_url:
+            # Imported lazily so single-process deployments don't need the package
+            import redis.asyncio as redis
+            self._redis = redis.from_url(redis_url)
+            logger.info("Conversation state stored in Redis")
+    
+    @staticmethod
+    def _key(call_sid: str) -> str:
+        return f"conversation:{call_sid}"
+    
+    async def get(self, call_sid: str) -> Optional[ConversationContext]:
+        """Get the conversation for a call, if any"""
+        if self._redis is None:
+            return self._local.get(call_sid)
+        
+        raw = await self._redis.get(self._key(call_sid))
+        if raw is None:
+            return None
+        return _CONTEXT_ADAPTER.validate_json(raw)
+    
+    async def set(self, call_sid: str, context: ConversationContext):
+        """Store the conversation, refreshing its idle TTL"""
+        if self._redis is None:
+            self._local[call_sid] = context
+            return
+        
+        payload = orjson.dumps(context)
+        await self._redis.set(self._key(call_sid), payload, ex=self.ttl_seconds)
+    
+    async def delete(self, call_sid: str) -> bool:
+        """Remove the conversation; returns whether it existed"""
+        if self._redis is None:
+            return self._local.pop(call_sid) is not None
+        
+        return bool(await self._redis.delete(self._key(call_sid)))
+    
+    async def aclose(self):
+        """Close the Redis connection pool"""
+        if self._redis is not None:
+            await self._redis.aclose()
\ No newline at end of file
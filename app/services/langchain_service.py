@@ -1,13 +1,33 @@
 from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate, MessagesPlaceholder
-from langchain.schema import BaseOutputParser
-from langchain.memory import ConversationBufferMemory
-from langchain.chains import ConversationChain
+from langchain.prompts import ChatPromptTemplate, HumanMessagePromptTemplate, MessagesPlaceholder
+from langchain.schema import BaseOutputParser, SystemMessage
+from langchain.memory import ConversationBufferWindowMemory
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import Runnable
 from loguru import logger
 from app.config.settings import settings
-from typing import Dict, List, Any
+from app.utils.ttl_cache import TTLCache
+from typing import Dict, List, Any, Optional, Tuple
+import asyncio
+import hashlib
+import orjson
 import re
-import json
+
+
+_DEFAULT_REPLY = "¿Puedes repetir tu pedido, por favor?"
+
+# Every tag in one pass, wherever it appears; a value runs to "]", the next tag or the line end
+_TAG_RE = re.compile(
+    r'\[\s*(ACCIÓN|ACTION|PRODUCTO|PRODUCT|TAMAÑO|SIZE|CANTIDAD|QUANTITY|RESPUESTA|RESPONSE)\s*:\s*([^\[\]\n]*)\]?',
+    re.IGNORECASE
+)
+_TAG_NAMES = {
+    "ACCIÓN": "action", "ACTION": "action",
+    "PRODUCTO": "product", "PRODUCT": "product",
+    "TAMAÑO": "size", "SIZE": "size",
+    "CANTIDAD": "quantity", "QUANTITY": "quantity",
+    "RESPUESTA": "response", "RESPONSE": "response",
+}
 
 
 class PizzaOrderParser(BaseOutputParser):
@@ -16,61 +36,73 @@ class PizzaOrderParser(BaseOutputParser):
     def parse(self, text: str) -> Dict[str, Any]:
         """Parse AI response to extract action and parameters"""
         try:
-            lines = text.strip().split('\n')
-            
             action = "clarification"
             product = None
             size = None
             quantity = 1
-            response_text = "¿Puedes repetir tu pedido, por favor?"
+            products: List[Dict[str, Any]] = []  # One entry per [PRODUCTO:] tag
+            # Size/quantity seen before their product ("[CANTIDAD: 2] [PRODUCTO: X]")
+            pending: Dict[str, Any] = {}
+            response_text = None
             
-            for line in lines:
-                line = line.strip()
-                if line.startswith('[ACCIÓN:') or line.startswith('[ACTION:'):
-                    action = line.split(':')[1].strip().rstrip(']')
-                elif line.startswith('[PRODUCTO:') or line.startswith('[PRODUCT:'):
-                    product = line.split(':')[1].strip().rstrip(']')
-                elif line.startswith('[TAMAÑO:') or line.startswith('[SIZE:'):
-                    size = line.split(':')[1].strip().rstrip(']')
-                elif line.startswith('[CANTIDAD:') or line.startswith('[QUANTITY:'):
-                    try:
-                        quantity = int(line.split(':')[1].strip().rstrip(']'))
-                    except ValueError:
-                        quantity = 1
-                elif line.startswith('[RESPUESTA:') or line.startswith('[RESPONSE:'):
-                    response_text = line.split(':', 1)[1].strip().rstrip(']')
+            for match in _TAG_RE.finditer(text):
+                tag = _TAG_NAMES[match.group(1).upper()]
+                value = match.group(2).strip()
+                if tag == "action":
+                    action = value
+                elif tag == "product":
+                    product = value
+                    products.append({"product": product, "size": None, "quantity": None, **pending})
+                    pending = {}
+                elif tag in ("size", "quantity"):
+                    if tag == "size":
+                        size = value
+                    else:
+                        try:
+                            quantity = int(value)
+                        except ValueError:
+                            quantity = 1
+                        value = quantity
+                    # Belongs to the last product unless that one already has it
+                    if products and products[-1][tag] is None:
+                        products[-1][tag] = value
+                    else:
+                        pending[tag] = value
+                else:
+                    response_text = value
             
-            # Limpiar respuesta de etiquetas residuales
-            response_text = response_text.replace('[ACCIÓN: welcome]', '').replace('[ACCIÓN: add_product]', '').replace('[ACCIÓN: clarification]', '').replace('[ACCIÓN: error]', '').strip()
+            # A single product takes whatever size/quantity the reply gave
+            if len(products) == 1:
+                if products[0]["size"] is None:
+                    products[0]["size"] = size
+                if products[0]["quantity"] is None:
+                    products[0]["quantity"] = quantity
+            for entry in products:
+                if entry["quantity"] is None:
+                    entry["quantity"] = 1
             
-            # Si queda vacío, usar líneas sin etiquetas
-            if not response_text or response_text == "¿Puedes repetir tu pedido, por favor?":
-                clean_lines = []
-                for line in lines:
-                    line = line.strip()
-                    if not (line.startswith('[') and ']:' in line):
-                        clean_lines.append(line)
-                if clean_lines:
-                    response_text = ' '.join(clean_lines)
-                else:
-                    response_text = "¿Puedes repetir tu pedido, por favor?"
+            # Si no hay RESPUESTA, usar el texto sin etiquetas
+            if not response_text:
+                response_text = " ".join(_TAG_RE.sub(" ", text).split()) or _DEFAULT_REPLY
             
             return {
                 "action": action,
                 "response_text": response_text,
                 "product": product,
                 "size": size,
-                "quantity": quantity
+                "quantity": quantity,
+                "products": products
             }
             
         except Exception as e:
             logger.error(f"Error parsing AI response: {str(e)}")
             return {
                 "action": "clarification",
-                "response_text": "¿Puedes repetir tu pedido, por favor?",
+                "response_text": _DEFAULT_REPLY,
                 "product": None,
                 "size": None,
-                "quantity": 1
+                "quantity": 1,
+                "products": []
             }
 
 
@@ -86,24 +118,64 @@ class LangchainService:
             streaming=False
         )
         self.parser = PizzaOrderParser()
-        self.memories: Dict[str, ConversationBufferMemory] = {}
+        # Bounded like the conversation store, so calls that never send a final status can't leak
+        self.memories = TTLCache(
+            maxsize=settings.max_active_calls,
+            ttl=settings.call_idle_ttl_seconds,
+            name="llm_memories"
+        )
+        # Raw LLM replies by turn key (message, state, catalog and memory window)
+        self._response_cache = TTLCache(
+            maxsize=settings.llm_response_cache_size,
+            ttl=settings.llm_response_cache_ttl_seconds,
+            name="llm_responses"
+        )
+        self._llm_semaphore = asyncio.Semaphore(settings.llm_max_concurrency)
+        # (catalog version, prompt | llm chain) for the catalog currently being served
+        self._chain: Tuple[Optional[str], Optional[Runnable]] = (None, None)
         
+    def _get_chain(self, catalog: Dict, catalog_version: Optional[str] = None) -> Runnable:
+        """Prompt, LLM and text output for the catalog, composed once per catalog version"""
+        if catalog_version is not None and self._chain[0] == catalog_version:
+            return self._chain[1]
+        
+        prompt = ChatPromptTemplate.from_messages([
+            # A ready message, not a template: the menu is never scanned for {variables}
+            SystemMessage(content=self._get_system_prompt_template(catalog)),
+            MessagesPlaceholder(variable_name="chat_history"),
+            HumanMessagePromptTemplate.from_template("{input}")
+        ])
+        chain = prompt | self.llm | StrOutputParser()
+        if catalog_version is not None:
+            self._chain = (catalog_version, chain)
+        return chain
+    
+    def prepare_catalog(self, catalog: Dict, catalog_version: Optional[str]):
+        """Build the chain for a freshly loaded catalog ahead of the first turn"""
+        self._get_chain(catalog, catalog_version)
+    
     def _get_system_prompt_template(self, catalog: Dict) -> str:
         """Build system prompt template with catalog information"""
-        
         products = catalog.get('data', {}).get('products', [])
         pizza_sizes = catalog.get('data', {}).get('pizza_sizes', [])
         
-        products_text = "\\n".join([
-            f"- {p['name']}: {p['description']} - Precio base: ${p['base_price']}"
+        # One short line per item: the model only needs names to emit and prices to quote.
+        # Descriptions were most of the prompt tokens; product lookup uses the full catalog.
+        products_text = "\n".join(sorted(
+            f"- {p['name']}: ${p['base_price']}"
             for p in products
-        ])
+        ))
         
-        sizes_text = "\\n".join([
-            f"- {s['name']}: {s['description']} - Multiplicador: {s['price_multiplier']}x"
+        sizes_text = "\n".join(
+            f"- {s['name']}: {s['price_multiplier']}x"
             for s in pizza_sizes
-        ])
+        )
         
+        return self._render_system_prompt(products_text, sizes_text)
+    
+    @staticmethod
+    def _render_system_prompt(products_text: str, sizes_text: str) -> str:
+        """Fill the fixed instructions with the menu sections"""
         return f"""
 Eres un asistente de IA para Pizza Project, especializado en tomar pedidos de pizza por teléfono.
 
@@ -137,90 +209,141 @@ FORMATO DE RESPUESTA:
 [PRODUCTO: nombre_del_producto] (solo si es add_product)
 [TAMAÑO: nombre_del_tamaño] (solo si es pizza)
 [CANTIDAD: número] (solo si es add_product)
+(Si el cliente pide varios productos, repite PRODUCTO/TAMAÑO/CANTIDAD para cada uno)
 [RESPUESTA: tu respuesta al cliente]
 """
         
-    def _get_or_create_memory(self, call_sid: str) -> ConversationBufferMemory:
-        """Get or create conversation memory for call"""
-        if call_sid not in self.memories:
-            self.memories[call_sid] = ConversationBufferMemory(
-                return_messages=True,
-                memory_key="chat_history"
-            )
-        return self.memories[call_sid]
+    @staticmethod
+    def _new_memory(history: Optional[List[Dict[str, str]]] = None) -> ConversationBufferWindowMemory:
+        """Build a memory window seeded from stored conversation history"""
+        # Only the last k exchanges go into the prompt so token count stays flat on long calls
+        memory = ConversationBufferWindowMemory(
+            k=settings.llm_history_turns,
+            return_messages=True,
+            memory_key="chat_history"
+        )
+        for message in history or []:
+            if message["role"] == "user":
+                memory.chat_memory.add_user_message(message["content"])
+            elif message["role"] == "assistant":
+                memory.chat_memory.add_ai_message(message["content"])
+        return memory
+    
+    def _get_or_create_memory(
+        self,
+        call_sid: str,
+        history: Optional[List[Dict[str, str]]] = None
+    ) -> ConversationBufferWindowMemory:
+        """Get or create conversation memory for call, seeded from stored history"""
+        if settings.redis_url and history is not None:
+            # Turns of one call can land on different workers, so a local copy may be stale;
+            # the shared history is authoritative and nothing per call is kept here
+            return self._new_memory(history)
+        memory = self.memories.get(call_sid)
+        if memory is None:
+            memory = self.memories[call_sid] = self._new_memory(history)
+        return memory
     
     async def process_customer_input(
         self, 
         customer_message: str, 
-        conversation_context: Dict,
         catalog: Dict,
-        call_sid: str
+        call_sid: str,
+        cache_key: Optional[str] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+        catalog_version: Optional[str] = None
     ) -> Dict:
         """
         Process customer input using Langchain
         
         Args:
             customer_message: What the customer said
-            conversation_context: Current conversation state
             catalog: Pizza catalog for reference
             call_sid: Call identifier for memory management
+            cache_key: Response cache key for this turn (message, state, catalog);
+                the memory window sent to the model is added to it here
+            history: Stored conversation history, used to rebuild the memory
+                when this process has none for the call
+            catalog_version: Content hash of the catalog; the built chain
+                is reused while it stays the same
             
         Returns:
-            Dict with action, response_text, and context
+            Dict with action, response_text, and context_updates to apply
+            to the caller's ConversationContext
         """
         try:
-            memory = self._get_or_create_memory(call_sid)
-            
-            system_prompt = self._get_system_prompt_template(catalog)
-            
-            prompt = ChatPromptTemplate.from_messages([
-                SystemMessagePromptTemplate.from_template(system_prompt),
-                MessagesPlaceholder(variable_name="chat_history"),
-                HumanMessagePromptTemplate.from_template("{input}")
-            ])
-            
-            conversation = ConversationChain(
-                llm=self.llm,
-                prompt=prompt,
-                memory=memory,
-                verbose=True
-            )
+            memory = self._get_or_create_memory(call_sid, history)
+            chat_history = memory.load_memory_variables({})["chat_history"]
             
-            response = await conversation.apredict(input=customer_message)
-            logger.info(f"Langchain response: {response}")
+            if cache_key is not None:
+                # The reply depends on the exact window the model is shown, so that goes in the key
+                cache_key = hashlib.blake2b(
+                    orjson.dumps([cache_key, [(m.type, m.content) for m in chat_history]]),
+                    digest_size=16
+                ).hexdigest()
+                response = self._response_cache.get(cache_key)
+                if response is not None:
+                    logger.info("LLM response cache hit")
+                    # Keep the memory as if the LLM had answered, so later turns see this exchange
+                    memory.save_context({"input": customer_message}, {"response": response})
+                    return self._build_result(customer_message, response)
             
-            parsed_result = self.parser.parse(response)
-            logger.info(f"Parsed result: {parsed_result}")
+            chain = self._get_chain(catalog, catalog_version)
             
-            updated_context = conversation_context.copy()
-            if "conversation_history" not in updated_context:
-                updated_context["conversation_history"] = []
+            # Bursts queue here instead of piling concurrent requests onto the rate limit
+            async with self._llm_semaphore:
+                response = await chain.ainvoke({"input": customer_message, "chat_history": chat_history})
+            logger.debug("Langchain response: {}", response)
+            memory.save_context({"input": customer_message}, {"response": response})
             
-            updated_context["conversation_history"].extend([
-                {"role": "user", "content": customer_message},
-                {"role": "assistant", "content": parsed_result["response_text"]}
-            ])
-            
-            return {
-                **parsed_result,
-                "context": updated_context
-            }
+            if cache_key is not None:
+                self._response_cache[cache_key] = response
+            return self._build_result(customer_message, response)
             
         except Exception as e:
             logger.error(f"Error processing with Langchain: {str(e)}")
             return {
                 "action": "error",
                 "response_text": "Disculpa, tuve un problema técnico. ¿Puedes repetir tu pedido?",
-                "context": conversation_context,
+                "context_updates": {},
                 "product": None,
                 "size": None,
-                "quantity": 1
+                "quantity": 1,
+                "products": []
             }
     
+    def _build_result(self, customer_message: str, response: str) -> Dict:
+        """Parse an LLM reply into the action result for the conversation manager"""
+        parsed_result = self.parser.parse(response)
+        logger.info("Parsed result: {}", parsed_result)
+        
+        return {
+            **parsed_result,
+            "context_updates": {
+                "messages": [
+                    {"role": "user", "content": customer_message},
+                    {"role": "assistant", "content": parsed_result["response_text"]}
+                ]
+            }
+        }
+    
+    def record_exchange(
+        self,
+        call_sid: str,
+        customer_message: str,
+        reply: str,
+        history: Optional[List[Dict[str, str]]] = None
+    ):
+        """Add a turn answered without the LLM to the call's memory, so later prompts include it"""
+        if settings.redis_url and history is not None:
+            # Memory is rebuilt from the shared history on every LLM turn
+            return
+        memory = self._get_or_create_memory(call_sid, history)
+        memory.save_context({"input": customer_message}, {"response": reply})
+    
     def clear_memory(self, call_sid: str):
         """Clear conversation memory for a call"""
-        if call_sid in self.memories:
-            del self.memories[call_sid]
-            logger.info(f"Cleared Langchain memory for call {call_sid}")
+        if self.memories.pop(call_sid) is not None:
+            logger.info("Cleared Langchain memory for call {}", call_sid)
 
 langchain_service = LangchainService()
\ No newline at end of file
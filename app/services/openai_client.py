@@ -0,0 +1,17 @@
+import httpx
+from openai import AsyncOpenAI
+from app.config.settings import settings
+
+# One client, and so one connection pool to the OpenAI API, for transcription and extraction
+openai_client = AsyncOpenAI(
+    api_key=settings.openai_api_key,
+    max_retries=2,
+    timeout=10.0,
+    http_client=httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=200,
+            max_keepalive_connections=100
+        )
+    )
+)
@@ -1,7 +1,24 @@
+import asyncio
 import httpx
+import orjson
+import random
 from loguru import logger
 from app.config.settings import settings
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, Tuple
+
+# Bodies are encoded with orjson, so the content type is set by hand
+_JSON_HEADERS = {"Content-Type": "application/json"}
+# Failure logs show the start of the raw body; validation errors fit, HTML error pages don't flood
+_BODY_PREVIEW_BYTES = 512
+
+# Category words for the last-resort name match (substring checks, so "pizzas" counts)
+_PIZZA_TERMS = ('margarita', 'ny', 'vegetariana', 'pizza')
+_BEVERAGE_TERMS = ('coca', 'cola', 'agua', 'bebida')
+
+# Gateway errors while Laravel restarts or scales; only retried for repeatable requests
+_RETRY_STATUSES = frozenset({502, 503, 504})
+_RETRY_ATTEMPTS = 3
+_RETRY_BASE_DELAY = 0.1
 
 class PizzaAPIService:
     """Service to interact with Laravel Pizza API"""
@@ -9,42 +26,85 @@ class PizzaAPIService:
     def __init__(self):
         self.base_url = settings.laravel_api_base_url.rstrip('/')
         self.api_base = f"{self.base_url}/api/v1"
+        # One pooled client for all calls so connections are kept alive and reused
+        self.client = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(
+                # A turn's concurrent add-product requests multiplex on one connection
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=1000,
+                    max_keepalive_connections=100,
+                    # Outlive the gaps between a call's turns so later requests skip the handshake
+                    keepalive_expiry=120
+                ),
+                # Failed connection attempts only; nothing was sent, so any request can retry
+                retries=3
+            ),
+            # Fail fast on an unreachable API; order creation may legitimately take a while
+            timeout=httpx.Timeout(10.0, connect=3.0)
+        )
+    
+    async def aclose(self):
+        """Close pooled connections"""
+        await self.client.aclose()
+    
+    async def _request_with_retry(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Send a request that is safe to repeat, retrying gateway errors with jittered backoff"""
+        for attempt in range(_RETRY_ATTEMPTS):
+            response = await self.client.request(method, url, **kwargs)
+            if response.status_code not in _RETRY_STATUSES or attempt == _RETRY_ATTEMPTS - 1:
+                return response
+            delay = _RETRY_BASE_DELAY * 2 ** attempt
+            logger.warning(f"{method} {url} returned {response.status_code}, retrying")
+            await asyncio.sleep(delay + random.uniform(0, delay))
+        
+    async def get_catalog(self, etag: Optional[str] = None) -> Tuple[Optional[Dict], Optional[str]]:
+        """
+        Get complete pizza catalog optimized for AI
         
-    async def get_catalog(self) -> Optional[Dict]:
-        """Get complete pizza catalog optimized for AI"""
+        Returns (catalog, etag). When etag is given and the catalog hasn't
+        changed, returns (None, etag) without a body; on errors (None, None).
+        """
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{self.api_base}/ai/catalog")
+            headers = {"If-None-Match": etag} if etag else None
+            response = await self._request_with_retry("GET", f"{self.api_base}/ai/catalog", headers=headers)
+            
+            if response.status_code == 304:
+                logger.info("Catalog unchanged on Laravel API")
+                return None, etag
+            elif response.status_code == 200:
+                logger.info("Successfully fetched catalog from Laravel API")
+                catalog = orjson.loads(response.content)
+                # Lowercased once here rather than for every product on every name lookup
+                for product in catalog.get('data', {}).get('products', []):
+                    product['_name_lower'] = product['name'].lower()
+                return catalog, response.headers.get("ETag")
+            else:
+                logger.error(f"Failed to fetch catalog: {response.status_code}")
+                return None, None
                 
-                if response.status_code == 200:
-                    logger.info("Successfully fetched catalog from Laravel API")
-                    return response.json()
-                else:
-                    logger.error(f"Failed to fetch catalog: {response.status_code}")
-                    return None
-                    
         except Exception as e:
             logger.error(f"Error fetching catalog: {str(e)}")
-            return None
+            return None, None
     
     async def create_cart(self) -> Optional[Dict]:
         """Create a new shopping cart"""
         try:
             logger.info(f"Creating cart - POST {self.api_base}/cart/create")
-            async with httpx.AsyncClient() as client:
-                response = await client.post(f"{self.api_base}/cart/create")
-                
-                logger.info(f"Create cart response - Status: {response.status_code}, Body: {response.text}")
+            # A cart left over from a retried request is empty and harmless
+            response = await self._request_with_retry("POST", f"{self.api_base}/cart/create")
+            
+            logger.opt(lazy=True).debug("Create cart response - Status: {}, Body: {}", lambda: response.status_code, lambda: response.text)
+            
+            if response.status_code == 201:
+                result = orjson.loads(response.content)
+                cart_token = result['data']['cart_token']
+                logger.info(f"Created cart with token: {cart_token}")
+                return result['data']
+            else:
+                logger.error(f"Failed to create cart: {response.status_code}")
+                return None
                 
-                if response.status_code == 201:
-                    result = response.json()
-                    cart_token = result['data']['cart_token']
-                    logger.info(f"Created cart with token: {cart_token}")
-                    return result['data']
-                else:
-                    logger.error(f"Failed to create cart: {response.status_code}")
-                    return None
-                    
         except Exception as e:
             logger.error(f"Error creating cart: {str(e)}")
             return None
@@ -69,21 +129,21 @@ class PizzaAPIService:
             
             logger.info(f"Adding product to cart - POST {self.api_base}/cart/add-product with payload: {payload}")
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.api_base}/cart/add-product",
-                    json=payload
-                )
-                
-                logger.info(f"Add product response - Status: {response.status_code}, Body: {response.text}")
+            response = await self.client.post(
+                f"{self.api_base}/cart/add-product",
+                content=orjson.dumps(payload),
+                headers=_JSON_HEADERS
+            )
+            
+            logger.opt(lazy=True).debug("Add product response - Status: {}, Body: {}", lambda: response.status_code, lambda: response.text)
+            
+            if response.status_code == 200:
+                logger.info(f"Added product {product_id} to cart {cart_token}")
+                return True
+            else:
+                logger.error("Failed to add product to cart: {} - Response: {!r}", response.status_code, response.content[:_BODY_PREVIEW_BYTES])
+                return False
                 
-                if response.status_code == 200:
-                    logger.info(f"Added product {product_id} to cart {cart_token}")
-                    return True
-                else:
-                    logger.error(f"Failed to add product to cart: {response.status_code}")
-                    return False
-                    
         except Exception as e:
             logger.error(f"Error adding product to cart: {str(e)}")
             return False
@@ -92,18 +152,17 @@ class PizzaAPIService:
         """Get cart contents"""
         try:
             logger.info(f"Getting cart - GET {self.api_base}/cart/{cart_token}")
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{self.api_base}/cart/{cart_token}")
-                
-                logger.info(f"Get cart response - Status: {response.status_code}, Body: {response.text}")
+            response = await self._request_with_retry("GET", f"{self.api_base}/cart/{cart_token}")
+            
+            logger.opt(lazy=True).debug("Get cart response - Status: {}, Body: {}", lambda: response.status_code, lambda: response.text)
+            
+            if response.status_code == 200:
+                logger.info(f"Retrieved cart {cart_token}")
+                return orjson.loads(response.content)
+            else:
+                logger.error(f"Failed to get cart: {response.status_code}")
+                return None
                 
-                if response.status_code == 200:
-                    logger.info(f"Retrieved cart {cart_token}")
-                    return response.json()
-                else:
-                    logger.error(f"Failed to get cart: {response.status_code}")
-                    return None
-                    
         except Exception as e:
             logger.error(f"Error getting cart: {str(e)}")
             return None
@@ -128,25 +187,25 @@ class PizzaAPIService:
             
             logger.info(f"Creating order - POST {self.api_base}/orders with payload: {payload}")
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.api_base}/orders",
-                    json=payload
-                )
-                
-                logger.info(f"Create order response - Status: {response.status_code}, Body: {response.text}")
+            response = await self.client.post(
+                f"{self.api_base}/orders",
+                content=orjson.dumps(payload),
+                headers=_JSON_HEADERS
+            )
+            
+            logger.opt(lazy=True).debug("Create order response - Status: {}, Body: {}", lambda: response.status_code, lambda: response.text)
+            
+            if response.status_code == 201:
+                result = orjson.loads(response.content)
+                order_id = result['data']['id']
+                view_url = result.get('view_url', '')
+                logger.info(f"Created order {order_id} with URL: {view_url}")
+                logger.opt(lazy=True).debug("Full order creation response: {}", lambda: result)
+                return result
+            else:
+                logger.error("Failed to create order: {} - Response: {!r}", response.status_code, response.content[:_BODY_PREVIEW_BYTES])
+                return None
                 
-                if response.status_code == 201:
-                    result = response.json()
-                    order_id = result['data']['id']
-                    view_url = result.get('view_url', '')
-                    logger.info(f"Created order {order_id} with URL: {view_url}")
-                    logger.info(f"Full order creation response: {result}")
-                    return result
-                else:
-                    logger.error(f"Failed to create order: {response.status_code} - Response: {response.text}")
-                    return None
-                    
         except Exception as e:
             logger.error(f"Error creating order: {str(e)}")
             return None
@@ -160,25 +219,26 @@ class PizzaAPIService:
             
             products = catalog.get('data', {}).get('products', [])
             
+            search_term = product_name.lower()
+            
             for product in products:
-                if product_name.lower() in product['name'].lower():
+                if search_term in product['_name_lower']:
                     return product
             
-            pizza_terms = ['margarita', 'ny', 'vegetariana', 'pizza']
-            beverage_terms = ['coca', 'cola', 'agua', 'bebida']
-            
-            search_term = product_name.lower()
+            # Which categories the request mentions doesn't change per product
+            wants_pizza = any(term in search_term for term in _PIZZA_TERMS)
+            wants_beverage = any(term in search_term for term in _BEVERAGE_TERMS)
+            if not (wants_pizza or wants_beverage):
+                return None
             
             for product in products:
-                product_name_lower = product['name'].lower()
+                product_name_lower = product['_name_lower']
                 
-                if any(term in search_term for term in pizza_terms):
-                    if any(term in product_name_lower for term in pizza_terms):
-                        return product
+                if wants_pizza and any(term in product_name_lower for term in _PIZZA_TERMS):
+                    return product
                 
-                if any(term in search_term for term in beverage_terms):
-                    if any(term in product_name_lower for term in beverage_terms):
-                        return product
+                if wants_beverage and any(term in product_name_lower for term in _BEVERAGE_TERMS):
+                    return product
             
             return None
             
@@ -186,7 +246,7 @@ class PizzaAPIService:
             logger.error(f"Error finding product: {str(e)}")
             return None
     
-    async def get_pizza_sizes(self, catalog: Dict) -> List[Dict]:
+    def get_pizza_sizes(self, catalog: Dict) -> List[Dict]:
         """Get available pizza sizes from catalog"""
         try:
             return catalog.get('data', {}).get('pizza_sizes', [])
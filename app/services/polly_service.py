@@ -1,21 +1,33 @@
-import boto3
+import asyncio
 from io import BytesIO
 import base64
 from loguru import logger
 from app.services.aws_config import aws_config
-from typing import Optional
+from app.utils.mulaw import pcm16_to_ulaw
+from collections import OrderedDict
+from typing import FrozenSet, Iterable, Optional, Tuple
 
 class PollyService:
     """Amazon Polly text-to-speech service"""
     
-    def __init__(self):
-        self.client = aws_config.get_polly_client()
+    def __init__(self, cache_size: int = 512):
+        # Synthesized audio keyed by (text, voice, format, rate); most prompts are fixed strings
+        self._audio_cache: "OrderedDict[Tuple[str, str, str, str], bytes]" = OrderedDict()
+        self._cache_size = cache_size
+        # Only the fixed prompts given to prewarm are cached; LLM replies and cart summaries
+        # are one-off and would evict them
+        self._cacheable_texts: FrozenSet[str] = frozenset()
         
+    @property
+    def client(self):
+        """Polly client, created on first synthesis rather than at import"""
+        return aws_config.get_polly_client()
+    
     async def synthesize_speech(
         self, 
         text: str, 
         voice_id: str = "Conchita",
-        output_format: str = "mp3",
+        output_format: str = "pcm",
         sample_rate: str = "8000"
     ) -> Optional[bytes]:
         """
@@ -24,33 +36,61 @@ class PollyService:
         Args:
             text: Text to convert to speech
             voice_id: Voice to use (Conchita for Spanish)
-            output_format: Audio format (mp3, ogg_vorbis, pcm)
-            sample_rate: Sample rate for phone calls (8000 for µ-law)
+            output_format: Audio format (mp3, ogg_vorbis, pcm); pcm is raw 16-bit
+                mono, which the media stream converts straight to µ-law
+            sample_rate: Sample rate for phone calls (8000 for µ-law, so no resampling)
             
         Returns:
             Audio bytes or None if error
         """
+        cache_key = (text, voice_id, output_format, sample_rate)
+        cached = self._audio_cache.get(cache_key)
+        if cached is not None:
+            self._audio_cache.move_to_end(cache_key)
+            return cached
+        
         try:
             logger.info(f"Synthesizing speech: '{text[:50]}...' with voice {voice_id}")
             
-            response = self.client.synthesize_speech(
-                Text=text,
-                OutputFormat=output_format,
-                VoiceId=voice_id,
-                SampleRate=sample_rate,
-                LanguageCode="es-ES"
+            # boto3 is blocking; run it in a worker thread so other calls keep being served
+            audio_bytes = await asyncio.to_thread(
+                self._synthesize,
+                text,
+                voice_id,
+                output_format,
+                sample_rate
             )
             
-            audio_stream = response['AudioStream']
-            audio_bytes = audio_stream.read()
-            
             logger.info(f"Successfully synthesized {len(audio_bytes)} bytes of audio")
+            
+            if text in self._cacheable_texts:
+                self._audio_cache[cache_key] = audio_bytes
+                if len(self._audio_cache) > self._cache_size:
+                    self._audio_cache.popitem(last=False)
             return audio_bytes
             
         except Exception as e:
             logger.error(f"Error synthesizing speech: {str(e)}")
             return None
     
+    def _synthesize(self, text: str, voice_id: str, output_format: str, sample_rate: str) -> bytes:
+        """Blocking Polly request returning the audio bytes"""
+        response = self.client.synthesize_speech(
+            Text=text,
+            OutputFormat=output_format,
+            VoiceId=voice_id,
+            SampleRate=sample_rate,
+            LanguageCode="es-ES"
+        )
+        return response['AudioStream'].read()
+    
+    async def prewarm(self, texts: Iterable[str]):
+        """Synthesize fixed prompts ahead of time so calls hit the cache"""
+        texts = tuple(texts)
+        self._cacheable_texts |= frozenset(texts)
+        await asyncio.gather(*(self.synthesize_speech(text) for text in texts))
+        logger.info(f"Polly cache pre-warmed with {len(self._audio_cache)} prompts")
+    
     async def synthesize_speech_for_phone(self, text: str) -> Optional[str]:
         """
         Synthesize speech optimized for phone calls and return as base64
@@ -59,20 +99,16 @@ class PollyService:
             text: Text to convert to speech
             
         Returns:
-            Base64 encoded audio or None if error
+            Base64 encoded 8 kHz µ-law audio (what Twilio plays) or None if error
         """
         try:
-            response = self.client.synthesize_speech(
-                Text=text,
-                OutputFormat="pcm",
-                VoiceId="Conchita",
-                SampleRate="8000",
-                LanguageCode="es-ES"
-            )
-            
-            audio_bytes = response['AudioStream'].read()
+            # Through the shared cache: phone prompts are the same fixed strings
+            audio_bytes = await self.synthesize_speech(text, "Conchita", "pcm", "8000")
+            if audio_bytes is None:
+                return None
             
-            audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
+            # µ-law is half the size of 16-bit PCM; base64 output is plain ASCII
+            audio_base64 = base64.b64encode(pcm16_to_ulaw(audio_bytes)).decode('ascii')
             
             logger.info(f"Phone audio synthesized: {len(audio_base64)} chars base64")
             return audio_base64
@@ -1,16 +1,41 @@
+import asyncio
 import httpx
-import tempfile
-import os
-from openai import OpenAI
+import io
+from app.services.openai_client import openai_client
 from loguru import logger
 from app.config.settings import settings
-from typing import Optional
+from typing import BinaryIO, Optional, Union
+
+# Whisper requests in flight across all calls, media streams and recordings alike
+_whisper_semaphore = asyncio.Semaphore(settings.whisper_max_concurrency)
+
+_DOWNLOAD_CHUNK_BYTES = 64 * 1024
+_MAX_RECORDING_BYTES = 25 * 1024 * 1024  # Whisper's upload limit
 
 class TranscribeService:
     """OpenAI Whisper speech-to-text service"""
     
     def __init__(self):
-        self.client = OpenAI(api_key=settings.openai_api_key)
+        # Recording downloads reuse pooled connections to Twilio instead of a client per request
+        self.http = httpx.AsyncClient(
+            auth=(settings.twilio_account_sid, settings.twilio_auth_token),
+            follow_redirects=True,
+            timeout=httpx.Timeout(10.0, connect=3.0)
+        )
+    
+    async def aclose(self):
+        """Close pooled connections"""
+        await self.http.aclose()
+    
+    async def transcribe_wav(self, audio: Union[bytes, BinaryIO], language_code: str = "es") -> str:
+        """Transcribe in-memory WAV audio; excess requests queue here instead of tripping rate limits"""
+        async with _whisper_semaphore:
+            transcript = await openai_client.audio.transcriptions.create(
+                model="whisper-1",
+                file=("audio.wav", audio, "audio/wav"),
+                language=language_code
+            )
+        return transcript.text.strip()
         
     async def transcribe_audio_from_url(
         self, 
@@ -31,32 +56,23 @@ class TranscribeService:
             logger.info(f"Starting Whisper transcription from URL: {audio_url}")
             
             # Download audio file with Twilio authentication
-            auth = (settings.twilio_account_sid, settings.twilio_auth_token)
-            async with httpx.AsyncClient() as client:
-                response = await client.get(audio_url, auth=auth)
+            async with self.http.stream("GET", audio_url) as response:
                 response.raise_for_status()
                 
-                # Save to temporary file
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as temp_file:
-                    temp_file.write(response.content)
-                    temp_file_path = temp_file.name
+                # Gather chunks into one in-memory file: a single copy and no disk round-trip.
+                # Recordings are short; anything Whisper would reject anyway is cut off early
+                audio = io.BytesIO()
+                async for chunk in response.aiter_bytes(_DOWNLOAD_CHUNK_BYTES):
+                    audio.write(chunk)
+                    if audio.tell() > _MAX_RECORDING_BYTES:
+                        logger.error(f"Recording exceeds {_MAX_RECORDING_BYTES} bytes: {audio_url}")
+                        return None
+            audio.seek(0)
             
-            try:
-                # Transcribe with Whisper
-                with open(temp_file_path, 'rb') as audio_file:
-                    transcript = self.client.audio.transcriptions.create(
-                        model="whisper-1",
-                        file=audio_file,
-                        language=language_code
-                    )
-                
-                text = transcript.text.strip()
-                logger.info(f"Whisper transcription result: '{text}'")
-                return text
-                
-            finally:
-                # Clean up temporary file
-                os.unlink(temp_file_path)
+            # Same Whisper path and concurrency cap as the media stream
+            text = await self.transcribe_wav(audio, language_code)
+            logger.info(f"Whisper transcription result: '{text}'")
+            return text
             
         except Exception as e:
             logger.error(f"Error with Whisper transcription: {str(e)}")
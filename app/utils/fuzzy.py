@@ -0,0 +1,38 @@
+from typing import Iterable, Optional
+
+def bounded_levenshtein(a: str, b: str, k: int) -> int:
+    """Edit distance between a and b if it is at most k, else k + 1"""
+    if abs(len(a) - len(b)) > k:
+        return k + 1
+    if len(a) > len(b):
+        a, b = b, a
+    # Only cells within k of the diagonal can stay under the bound
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        low = max(1, i - k)
+        high = min(len(b), i + k)
+        current = [k + 1] * (len(b) + 1)
+        if low == 1:
+            current[0] = i
+        for j in range(low, high + 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != b[j - 1])
+            )
+        # Every path through this row already costs more than k
+        if min(current[low - 1:high + 1]) > k:
+            return k + 1
+        previous = current
+    return min(previous[len(b)], k + 1)
+
+def closest_word(word: str, candidates: Iterable[str], k: int) -> Optional[str]:
+    """Candidate within edit distance k of word (the closest one), or None"""
+    best, best_distance = None, k + 1
+    for candidate in candidates:
+        distance = bounded_levenshtein(word, candidate, best_distance - 1)
+        if distance < best_distance:
+            best, best_distance = candidate, distance
+            if distance == 0:
+                break
+    return best
@@ -0,0 +1,44 @@
+import numpy as np
+
+# G.711 mu-law <-> 16-bit linear PCM via lookup tables, so no per-sample Python or
+# audioop (removed in Python 3.13) on the audio path
+_DECODE_BIAS = 0x84
+_ENCODE_BIAS = 0x21  # Encoder works on 14-bit samples
+_CLIP = 8159
+
+def _build_decode_table() -> np.ndarray:
+    """Linear sample for each of the 256 mu-law bytes"""
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    exponent = (codes >> 4) & 0x07
+    mantissa = codes & 0x0F
+    magnitude = (((mantissa << 3) + _DECODE_BIAS) << exponent) - _DECODE_BIAS
+    return np.where(codes & 0x80, -magnitude, magnitude).astype(np.int16)
+
+def _build_encode_table() -> np.ndarray:
+    """Mu-law byte for each of the 65536 linear samples (indexed as uint16), as audioop encodes"""
+    samples = np.arange(65536, dtype=np.int32)
+    samples = np.where(samples >= 32768, samples - 65536, samples) >> 2  # 14-bit
+    mask = np.where(samples < 0, 0x7F, 0xFF)
+    magnitude = np.minimum(np.abs(samples), _CLIP) + _ENCODE_BIAS
+    segment = np.floor(np.log2(magnitude)).astype(np.int32) - 5
+    codes = (np.minimum(segment, 7) << 4) | ((magnitude >> (np.minimum(segment, 7) + 1)) & 0x0F)
+    codes = np.where(segment >= 8, 0x7F, codes)  # Clipped samples
+    return (codes ^ mask).astype(np.uint8)
+
+_ULAW_TO_PCM = _build_decode_table()
+_PCM_TO_ULAW = _build_encode_table()
+
+def ulaw_to_pcm16(data: bytes) -> np.ndarray:
+    """Decode mu-law bytes to int16 samples"""
+    return _ULAW_TO_PCM[np.frombuffer(data, dtype=np.uint8)]
+
+def pcm16_to_ulaw(pcm: bytes) -> bytes:
+    """Encode little-endian 16-bit PCM bytes as mu-law"""
+    samples = np.frombuffer(pcm, dtype="<i2", count=len(pcm) // 2)
+    return _PCM_TO_ULAW[samples.view(np.uint16)].tobytes()
+
+def rms(samples: np.ndarray) -> float:
+    """Root mean square of int16 samples"""
+    if samples.size == 0:
+        return 0.0
+    return float(np.sqrt(np.mean(np.square(samples, dtype=np.float64))))
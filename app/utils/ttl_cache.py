@@ -0,0 +1,76 @@
+import time
+from collections import OrderedDict
+from loguru import logger
+from typing import Any, Hashable, Iterator
+
+class TTLCache:
+    """Bounded LRU mapping whose entries also expire after an idle TTL"""
+    
+    def __init__(self, maxsize: int, ttl: float, name: str = "cache"):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+    
+    def _expire(self):
+        """Drop entries idle for longer than the TTL (oldest first)"""
+        now = time.monotonic()
+        expired = 0
+        while self._data:
+            key, (_, touched_at) = next(iter(self._data.items()))
+            if now - touched_at < self.ttl:
+                break
+            del self._data[key]
+            expired += 1
+        # Keys can be customer messages, so only counts are logged
+        if expired:
+            logger.debug("[{}] Expired {} idle entries", self.name, expired)
+    
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get value and mark it as recently used"""
+        self._expire()
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        self._data[key] = (entry[0], time.monotonic())
+        self._data.move_to_end(key)
+        return entry[0]
+    
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove key and return its value"""
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+    
+    def __setitem__(self, key: Hashable, value: Any):
+        self._expire()
+        self._data[key] = (value, time.monotonic())
+        self._data.move_to_end(key)
+        evicted = 0
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            evicted += 1
+        if evicted:
+            logger.debug("[{}] Evicted {} least recently used entries", self.name, evicted)
+    
+    def __getitem__(self, key: Hashable) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+    
+    def __delitem__(self, key: Hashable):
+        del self._data[key]
+    
+    def __contains__(self, key: Hashable) -> bool:
+        self._expire()
+        return key in self._data
+    
+    def __len__(self) -> int:
+        self._expire()
+        return len(self._data)
+    
+    def __iter__(self) -> Iterator[Hashable]:
+        self._expire()
+        return iter(list(self._data))
+
+_MISSING = object()
\ No newline at end of file
@@ -0,0 +1,4 @@
+import os
+
+# The services build their SDK clients at import; they only need a key to exist
+os.environ.setdefault("OPENAI_API_KEY", "test")
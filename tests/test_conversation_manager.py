@@ -0,0 +1,48 @@
+import pytest
+from app.handlers.conversation_manager import conversation_manager
+
+def extract_name(message: str):
+    return conversation_manager._extract_customer_info_regex(message)["name"]
+
+@pytest.mark.parametrize("message, name", [
+    ("Me llamo Juan Pérez", "Juan Pérez"),
+    ("Mi nombre es Ana, mi teléfono es 555 1234", "Ana"),
+    ("Hola, soy María López y vivo en calle Juárez 12", "María López"),
+    ("Soy Ana.", "Ana"),
+    ("Mi nombre es Luis. Mi dirección es Calle Sol 3.", "Luis"),
+    ("Me llamo Ana. Vivo en calle Sol 3", "Ana"),
+    ("Buenas tardes. Soy Carlos Ruiz. Mi teléfono es 5551234", "Carlos Ruiz"),
+])
+def test_regex_extracts_names(message, name):
+    assert extract_name(message) == name
+
+@pytest.mark.parametrize("message", [
+    "Sí, soy cliente nuevo",
+    "Hola, soy de la colonia Roma",
+    "Soy el de la pizza de ayer",
+    "Soy nueva aquí",
+    "Soy yo",
+    "Soy alérgico al gluten",
+    "Quiero una pizza. Soy alérgico al gluten, sin queso por favor",
+])
+def test_regex_ignores_soy_phrases_that_are_not_names(message):
+    assert extract_name(message) is None
+
+def extract_address(message: str):
+    return conversation_manager._extract_customer_info_regex(message)["address"]
+
+@pytest.mark.parametrize("message, address", [
+    ("Vivo en Calle Sol 3. Mi teléfono es 5551234", "Calle Sol 3"),
+    ("Mi dirección es Avenida Reforma 100. Gracias.", "Avenida Reforma 100"),
+    ("Está en la calle Juárez 12, gracias", "calle Juárez 12"),
+    ("¿Me la traes a la calle Sol 3? Soy Luis", "calle Sol 3"),
+])
+def test_regex_address_stops_at_sentence_end(message, address):
+    assert extract_address(message) == address
+
+@pytest.mark.parametrize("message", [
+    "Quiero una pizza, la calle es larga",
+    "La calle de mi casa está cerrada. Quiero una pizza",
+])
+def test_regex_ignores_bare_calle_without_street(message):
+    assert extract_address(message) is None
@@ -0,0 +1,31 @@
+from app.services.langchain_service import PizzaOrderParser
+
+parser = PizzaOrderParser()
+
+def test_tags_after_product_attach_to_it():
+    result = parser.parse(
+        "[ACCIÓN: add_product]\n[PRODUCTO: Pizza Margarita]\n[TAMAÑO: Grande]\n[CANTIDAD: 2]\n[RESPUESTA: Listo]"
+    )
+    assert result["products"] == [{"product": "Pizza Margarita", "size": "Grande", "quantity": 2}]
+
+def test_quantity_before_product_attaches_to_next_product():
+    result = parser.parse(
+        "[ACCIÓN: add_product]\n[CANTIDAD: 2]\n[PRODUCTO: Pizza Margarita]\n[TAMAÑO: Grande]\n[RESPUESTA: Listo]"
+    )
+    assert result["products"] == [{"product": "Pizza Margarita", "size": "Grande", "quantity": 2}]
+
+def test_multiple_products_keep_their_own_tags():
+    result = parser.parse(
+        "[ACCIÓN: add_product]\n"
+        "[PRODUCTO: Pizza Margarita]\n[TAMAÑO: Grande]\n[CANTIDAD: 2]\n"
+        "[CANTIDAD: 3]\n[PRODUCTO: Coca Cola]\n"
+        "[RESPUESTA: Listo]"
+    )
+    assert result["products"] == [
+        {"product": "Pizza Margarita", "size": "Grande", "quantity": 2},
+        {"product": "Coca Cola", "size": None, "quantity": 3},
+    ]
+
+def test_missing_tags_default():
+    result = parser.parse("[ACCIÓN: add_product]\n[PRODUCTO: Coca Cola]\n[RESPUESTA: Listo]")
+    assert result["products"] == [{"product": "Coca Cola", "size": None, "quantity": 1}]